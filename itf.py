@@ -1,13 +1,1858 @@
 import sys
 import os
+import io
+import time
 import traceback
+import re
+import math
+import bisect
+import hashlib
+import importlib
+import argparse
+import tempfile
+import queue
+import struct
+import functools
+from concurrent.futures import Future
 from datetime import datetime
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
-from PIL import Image, ImageTk, ImageDraw
-import keyboard
+from tkinter import filedialog, messagebox, ttk, colorchooser
 import threading
 import json
+from collections import OrderedDict
+
+# Момент старта процесса (для замеров фаз запуска)
+PROCESS_START = time.perf_counter()
+
+# Целевое время появления главного окна, мс
+STARTUP_TARGET_MS = 300
+
+
+class LazyModule:
+    """Модуль, который импортируется при первом обращении к атрибуту"""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+    
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+    
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+    
+    def __setattr__(self, attr, value):
+        # Свои поля - у прокси, остальное (Image.MAX_IMAGE_PIXELS) - у самого модуля
+        if attr.startswith('_'):
+            object.__setattr__(self, attr, value)
+        else:
+            setattr(self.load(), attr, value)
+
+
+# Тяжелые зависимости загружаются лениво, чтобы не тормозить старт окна
+Image = LazyModule('PIL.Image')
+ImageTk = LazyModule('PIL.ImageTk')
+ImageChops = LazyModule('PIL.ImageChops')
+ImageCms = LazyModule('PIL.ImageCms')
+keyboard = LazyModule('keyboard')
+
+
+class StartupProfiler:
+    """Замер фаз запуска программы"""
+    def __init__(self, start=PROCESS_START):
+        self.start = start
+        self.phases = []
+        self.reported = False
+    
+    def mark(self, name):
+        elapsed = (time.perf_counter() - self.start) * 1000
+        self.phases.append((name, elapsed))
+        return elapsed
+    
+    def elapsed(self, name):
+        for phase, elapsed in self.phases:
+            if phase == name:
+                return elapsed
+        return None
+    
+    def report(self):
+        """Вывод таймингов в консоль, возвращает краткую строку"""
+        self.reported = True
+        parts = [f"{name}: {elapsed:.0f} мс" for name, elapsed in self.phases]
+        print("⏱ Запуск: " + ", ".join(parts))
+        
+        visible = self.elapsed("window_visible")
+        if visible is None:
+            return ""
+        if visible > STARTUP_TARGET_MS:
+            print(f"⚠ Окно появилось за {visible:.0f} мс (цель {STARTUP_TARGET_MS} мс)")
+        return f"Окно за {visible:.0f} мс"
+
+# Расширения файлов, которые открывает программа
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff', '.tif', '.webp', '.ico', '.icns')
+
+# Сколько соседних файлов в каждую сторону подгружать в режиме папки
+SLIDESHOW_PREFETCH = 2
+
+# Глобальные клавиши листания папки (работают и для окна поверх экрана).
+# Регистрируются, только пока открыта папка через меню; ctrl+shift+стрелки
+# не берем - это выделение по словам во всех программах
+SLIDESHOW_NEXT_KEY = "ctrl+alt+page down"
+SLIDESHOW_PREV_KEY = "ctrl+alt+page up"
+
+# Бюджет памяти на изображение, МБ: больше - хранится уменьшенная рабочая копия.
+# Временно при декодировании допускается превышение в DECODE_HEADROOM раз
+MEMORY_BUDGET_MB = 512
+DECODE_HEADROOM = 4
+
+# Размер превью, пока Canvas еще не отрисован: по нему выбирается уровень
+# многоуровневых файлов при первом открытии
+PREVIEW_DEFAULT_SIZE = (800, 600)
+
+# Дисковый кэш битмапов: лимит по умолчанию, размеры миниатюр и превью
+DISK_CACHE_MAX_MB = 256
+THUMBNAIL_SIZE = (48, 48)
+DISK_PREVIEW_MAX = 1600
+
+# Задержка записи настроек, с (частые изменения сливаются в одну запись)
+SETTINGS_SAVE_DELAY = 1.0
+
+# Сколько файлов помнить в меню "Недавние"
+RECENT_FILES_MAX = 10
+
+# Перетаскивание окна поверх экрана: длительность кадра, мс, и зона прилипания, px
+DRAG_FRAME_MS = 16
+DRAG_SNAP_PX = 16
+
+# Щелчки колесика мыши за это время, мс, сливаются в одно событие
+WHEEL_FRAME_MS = 16
+
+# Как часто перечитывать список мониторов, с (смена размера экрана - сразу)
+DISPLAY_REFRESH_S = 30.0
+
+# Плавное появление и скрытие окна поверх экрана: длительность, мс, и частота кадров
+FADE_MS = 180
+ANIMATION_FPS = 60
+
+# Сколько вырезанных областей держать в памяти
+REGION_CACHE_ITEMS = 16
+
+# Режимы сравнения со вторым изображением
+COMPARE_MODES = {
+    'off': "Выключено",
+    'blend': "Наложение",
+    'difference': "Разница",
+    'split': "Шторка",
+}
+
+# Сколько размеров (превью, окно поверх экрана) хранить подготовленными для сравнения
+COMPARE_CACHE_ITEMS = 4
+
+# Коррекция изображения: значения по умолчанию (ничего не меняют)
+ADJUSTMENT_DEFAULTS = {
+    'grayscale': False,
+    'brightness': 100,
+    'contrast': 100,
+    'invert': False,
+    'tint': 0,
+    'tint_color': '#3498db',
+}
+
+# Сколько промежуточных результатов коррекции хранить
+ADJUSTMENT_CACHE_ITEMS = 12
+
+# Сколько фоновых потоков обрабатывают изображения (превью, окно, сохранение)
+RENDER_WORKERS = 2
+
+# Версия формата записи действий (--record, см. itf_replay.py)
+TRACE_VERSION = 1
+
+# Позиции окна поверх экрана и их значки
+OVERLAY_POSITIONS = {
+    "top-left": "↖", "top-center": "⬆", "top-right": "↗",
+    "middle-left": "⬅", "center": "⏺", "middle-right": "➡",
+    "bottom-left": "↙", "bottom-center": "⬇", "bottom-right": "↘",
+}
+
+
+def anchor_point(position, width, height, screen_width, screen_height, origin=(0, 0)):
+    """Координаты левого верхнего угла окна для одной из позиций OVERLAY_POSITIONS.
+    
+    screen_width/screen_height и origin - область монитора, в которой ставится окно.
+    """
+    x, y = anchor_offset(position, width, height, screen_width, screen_height)
+    return origin[0] + x, origin[1] + y
+
+
+def anchor_offset(position, width, height, screen_width, screen_height):
+    if position == "top-left":
+        x, y = 10, 30
+    elif position == "top-center":
+        x = (screen_width - width) // 2
+        y = 30
+    elif position == "top-right":
+        x = screen_width - width - 10
+        y = 30
+    elif position == "middle-left":
+        x = 10
+        y = (screen_height - height) // 2
+    elif position == "center":
+        x = (screen_width - width) // 2
+        y = (screen_height - height) // 2
+    elif position == "middle-right":
+        x = screen_width - width - 10
+        y = (screen_height - height) // 2
+    elif position == "bottom-left":
+        x = 10
+        y = screen_height - height - 50
+    elif position == "bottom-center":
+        x = (screen_width - width) // 2
+        y = screen_height - height - 50
+    elif position == "bottom-right":
+        x = screen_width - width - 10
+        y = screen_height - height - 50
+    else:
+        x, y = 100, 100
+    return x, y
+
+
+def snap_position(x, y, width, height, screen_width, screen_height, distance=DRAG_SNAP_PX, origin=(0, 0)):
+    """Прилипание окна к позициям и краям экрана (области монитора с началом origin).
+    
+    Возвращает (x, y, позиция), где позиция - ключ OVERLAY_POSITIONS,
+    если окно прилипло к ней, иначе None.
+    """
+    for position in OVERLAY_POSITIONS:
+        ax, ay = anchor_point(position, width, height, screen_width, screen_height, origin)
+        if abs(x - ax) <= distance and abs(y - ay) <= distance:
+            return ax, ay, position
+    
+    for edge in (origin[0], origin[0] + screen_width - width):
+        if abs(x - edge) <= distance:
+            x = edge
+    for edge in (origin[1], origin[1] + screen_height - height):
+        if abs(y - edge) <= distance:
+            y = edge
+    return x, y, None
+
+
+def enable_dpi_awareness():
+    """Координаты Tk в физических пикселях (Windows, до создания окна).
+    
+    Иначе Windows растягивает окно программы на мониторах с масштабом
+    больше 100%, и окно поверх экрана получается размытым.
+    """
+    if sys.platform != 'win32':
+        return
+    import ctypes
+    try:
+        # Свой масштаб для каждого монитора
+        ctypes.windll.shcore.SetProcessDpiAwareness(2)
+    except (AttributeError, OSError):
+        try:
+            ctypes.windll.user32.SetProcessDPIAware()
+        except (AttributeError, OSError):
+            pass
+
+
+def windows_monitors():
+    """Мониторы Windows: EnumDisplayMonitors и GetDpiForMonitor"""
+    import ctypes
+    from ctypes import wintypes
+    
+    class MONITORINFOEXW(ctypes.Structure):
+        _fields_ = [('cbSize', wintypes.DWORD),
+                    ('rcMonitor', wintypes.RECT),
+                    ('rcWork', wintypes.RECT),
+                    ('dwFlags', wintypes.DWORD),
+                    ('szDevice', wintypes.WCHAR * 32)]
+    
+    monitors = []
+    
+    def on_monitor(handle, hdc, rect, data):
+        info = MONITORINFOEXW()
+        info.cbSize = ctypes.sizeof(info)
+        ctypes.windll.user32.GetMonitorInfoW(handle, ctypes.byref(info))
+        
+        scale = 1.0
+        try:
+            dpi_x, dpi_y = wintypes.UINT(), wintypes.UINT()
+            ctypes.windll.shcore.GetDpiForMonitor(handle, 0, ctypes.byref(dpi_x), ctypes.byref(dpi_y))
+            scale = dpi_x.value / 96.0
+        except (AttributeError, OSError):
+            pass
+        
+        full, work = info.rcMonitor, info.rcWork
+        monitors.append({
+            'name': info.szDevice,
+            'rect': (full.left, full.top, full.right - full.left, full.bottom - full.top),
+            'work': (work.left, work.top, work.right - work.left, work.bottom - work.top),
+            'scale': scale,
+            'primary': bool(info.dwFlags & 1),
+        })
+        return True
+    
+    callback_type = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HMONITOR, wintypes.HDC,
+                                       ctypes.POINTER(wintypes.RECT), wintypes.LPARAM)
+    ctypes.windll.user32.EnumDisplayMonitors(None, None, callback_type(on_monitor), 0)
+    return monitors
+
+
+# Строка xrandr с подключенным монитором: имя, основной ли, ШxВ+X+Y
+XRANDR_MONITOR = re.compile(r'^(\S+) connected (primary )?(\d+)x(\d+)\+(\d+)\+(\d+)')
+
+
+def xrandr_monitors(output=None):
+    """Мониторы X11 по выводу xrandr (масштаб X11 не сообщает - считаем 1).
+    
+    --current не опрашивает выходы заново (это занимает до секунды), а
+    отдает конфигурацию, которую X-сервер уже знает.
+    """
+    if output is None:
+        import subprocess
+        output = subprocess.run(['xrandr', '--current'], capture_output=True,
+                                text=True, timeout=2).stdout
+    
+    monitors = []
+    for line in output.splitlines():
+        match = XRANDR_MONITOR.match(line)
+        if match:
+            name, primary, width, height, x, y = match.groups()
+            rect = (int(x), int(y), int(width), int(height))
+            monitors.append({'name': name, 'rect': rect, 'work': rect,
+                             'scale': 1.0, 'primary': bool(primary)})
+    return monitors
+
+
+def monitor_at(monitors, x, y):
+    """Монитор, на котором точка (или ближайший к ней)"""
+    def distance(monitor):
+        left, top, width, height = monitor['rect']
+        dx = max(left - x, 0, x - (left + width - 1))
+        dy = max(top - y, 0, y - (top + height - 1))
+        return dx * dx + dy * dy
+    return min(monitors, key=distance)
+
+
+class DisplayGeometry:
+    """Мониторы: положение, рабочая область (без панели задач) и масштаб.
+    
+    Список запрашивается у системы один раз и кэшируется. Если изменился
+    размер экрана по данным Tk (подключили монитор, сменили разрешение),
+    список перечитывается сразу; раз в DISPLAY_REFRESH_S секунд - в фоновом
+    потоке, а до его окончания отдается прежний. Основной монитор - первый
+    в списке.
+    """
+    def __init__(self, root, refresh_s=DISPLAY_REFRESH_S):
+        self.root = root
+        self.refresh_s = refresh_s
+        self.monitors = []
+        self.signature = None
+        self.refreshed = 0.0
+        self.updating = False
+        self.fresh = None
+    
+    def current_signature(self):
+        root = self.root
+        return (root.winfo_screenwidth(), root.winfo_screenheight(),
+                root.winfo_vrootwidth(), root.winfo_vrootheight())
+    
+    def get(self):
+        """Список мониторов (из кэша, если конфигурация не менялась)"""
+        signature = self.current_signature()
+        if self.fresh is not None:
+            # Фоновое обновление закончилось
+            monitors, self.fresh = self.fresh, None
+            self.apply(monitors, signature)
+        
+        if not self.monitors or signature != self.signature:
+            self.refresh(signature)
+        elif time.monotonic() - self.refreshed > self.refresh_s and not self.updating:
+            self.updating = True
+            threading.Thread(target=self.query_in_background, name="itf-monitors", daemon=True).start()
+        return self.monitors
+    
+    def query(self):
+        """Мониторы по данным системы (без вызовов Tk - можно из любого потока)"""
+        try:
+            if sys.platform == 'win32':
+                return windows_monitors()
+            if sys.platform != 'darwin':
+                return xrandr_monitors()
+        except Exception as e:
+            print(f"Не удалось получить список мониторов: {e}")
+        return []
+    
+    def query_in_background(self):
+        self.fresh = self.query()
+        self.updating = False
+    
+    def refresh(self, signature=None):
+        self.apply(self.query(), signature)
+    
+    def apply(self, monitors, signature=None):
+        if not monitors:
+            # Один экран размером с экран Tk
+            rect = (0, 0, self.root.winfo_screenwidth(), self.root.winfo_screenheight())
+            monitors = [{'name': 'screen', 'rect': rect, 'work': rect, 'scale': 1.0, 'primary': True}]
+        
+        monitors.sort(key=lambda m: (not m['primary'], m['rect'][0], m['rect'][1]))
+        self.monitors = monitors
+        self.signature = signature or self.current_signature()
+        self.refreshed = time.monotonic()
+    
+    def monitor(self, index):
+        """Монитор по номеру (несуществующий номер - основной монитор)"""
+        monitors = self.get()
+        return monitors[index] if 0 <= index < len(monitors) else monitors[0]
+    
+    def describe(self, monitor, index):
+        left, top, width, height = monitor['rect']
+        text = f"{index + 1}: {width}×{height}"
+        if monitor['scale'] != 1.0:
+            text += f", {monitor['scale'] * 100:.0f}%"
+        if monitor['primary']:
+            text += " (основной)"
+        return text
+
+
+def instance_address():
+    """Адрес канала единственного экземпляра: (адрес, семейство)"""
+    user = os.environ.get('USERNAME') or os.environ.get('USER') or 'user'
+    if sys.platform == 'win32':
+        return rf'\\.\pipe\itf-{user}', 'AF_PIPE'
+    base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(base, f'itf-{user}.sock'), 'AF_UNIX'
+
+
+def connect_to_instance():
+    """Соединение с запущенным экземпляром или None, если его нет"""
+    from multiprocessing.connection import Client
+    
+    address, family = instance_address()
+    try:
+        return Client(address, family)
+    except OSError:
+        return None
+
+
+def unix_socket_alive(address):
+    """Слушает ли кто-нибудь Unix-сокет (False - файл остался от упавшего процесса)"""
+    import socket
+    
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(address)
+        return True
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False
+    except OSError:
+        # Нет прав и т.п. - сокет не трогаем
+        return True
+    finally:
+        probe.close()
+
+
+def request_instance(conn, message, data=None):
+    """Команда по открытому соединению.
+    
+    data - двоичные данные (например, изображение): идут отдельным кадром
+    следом за командой, без JSON и base64.
+    """
+    if data is not None:
+        message = dict(message, binary=True)
+    conn.send_bytes(json.dumps(message, ensure_ascii=False).encode('utf-8'))
+    if data is not None:
+        conn.send_bytes(data)
+    try:
+        return json.loads(conn.recv_bytes().decode('utf-8'))
+    except EOFError:
+        return {'ok': False, 'error': 'Соединение закрыто'}
+
+
+def send_to_instance(message, data=None):
+    """Отправка команды запущенному экземпляру.
+    
+    Возвращает ответ или None, если запущенного экземпляра нет.
+    """
+    conn = connect_to_instance()
+    if conn is None:
+        return None
+    
+    with conn:
+        return request_instance(conn, message, data)
+
+
+# Кадр потока изображений: 4 байта длины (big-endian), затем сами данные
+STREAM_HEADER = struct.Struct('>I')
+
+# Кадр больше этого считается испорченным потоком, МБ
+STREAM_MAX_FRAME_MB = 512
+
+
+def read_frames(stream):
+    """Кадры из потока с префиксом длины; пустой кадр или конец потока - конец"""
+    while True:
+        header = stream.read(STREAM_HEADER.size)
+        if len(header) < STREAM_HEADER.size:
+            return
+        size, = STREAM_HEADER.unpack(header)
+        if size == 0:
+            return
+        if size > STREAM_MAX_FRAME_MB * 1024 * 1024:
+            raise ValueError(f"Кадр слишком большой ({size} байт) - поток поврежден?")
+        
+        data = stream.read(size)
+        if len(data) < size:
+            raise ValueError(f"Поток оборвался посреди кадра ({len(data)} из {size} байт)")
+        yield data
+
+
+class InstanceServer:
+    """Прием команд от повторных запусков программы.
+    
+    Работает через Unix-сокет (или именованный канал в Windows).
+    handler вызывается в потоке соединения и должен вернуть ответ (dict).
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.listener = None
+        self.address = None
+        self.family = None
+    
+    def start(self):
+        """Запуск сервера, возвращает False если канал занят"""
+        from multiprocessing.connection import Listener
+        
+        self.address, self.family = instance_address()
+        lock = None
+        if self.family == 'AF_UNIX':
+            # Проверка, удаление старого сокета и bind - под блокировкой файла,
+            # иначе два одновременных запуска удалят сокеты друг друга
+            try:
+                import fcntl
+                lock = open(self.address + '.lock', 'w')
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            except OSError as e:
+                print(f"Не удалось заблокировать канал экземпляра: {e}")
+        
+        try:
+            if self.family == 'AF_UNIX' and os.path.exists(self.address):
+                if unix_socket_alive(self.address):
+                    return False
+                # Сокет остался от упавшего процесса
+                try:
+                    os.unlink(self.address)
+                except OSError:
+                    pass
+            
+            try:
+                self.listener = Listener(self.address, self.family)
+            except OSError as e:
+                print(f"Ошибка запуска канала экземпляра: {e}")
+                return False
+        finally:
+            if lock:
+                lock.close()
+        
+        threading.Thread(target=self.serve, name="itf-instance", daemon=True).start()
+        return True
+    
+    def serve(self):
+        while self.listener:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self.handle_connection, args=(conn,),
+                             name="itf-instance-conn", daemon=True).start()
+    
+    def handle_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = json.loads(conn.recv_bytes().decode('utf-8'))
+                except (EOFError, OSError):
+                    return
+                except ValueError as e:
+                    reply = {'ok': False, 'error': f"Неверное сообщение: {e}"}
+                else:
+                    # Двоичные данные идут следом отдельным кадром
+                    if message.get('binary'):
+                        try:
+                            message['data'] = conn.recv_bytes()
+                        except (EOFError, OSError):
+                            return
+                    try:
+                        reply = self.handler(message)
+                    except Exception as e:
+                        reply = {'ok': False, 'error': str(e)}
+                try:
+                    conn.send_bytes(json.dumps(reply, ensure_ascii=False).encode('utf-8'))
+                except OSError:
+                    return
+    
+    def close(self):
+        listener, self.listener = self.listener, None
+        if listener:
+            try:
+                listener.close()
+            except OSError:
+                pass
+
+
+def user_dir(kind):
+    """Папка программы в профиле пользователя: kind - 'config' или 'cache'"""
+    home = os.path.expanduser('~')
+    if sys.platform == 'win32':
+        if kind == 'cache':
+            return os.path.join(os.environ.get('LOCALAPPDATA') or home, 'itf', 'cache')
+        return os.path.join(os.environ.get('APPDATA') or home, 'itf')
+    if sys.platform == 'darwin':
+        base = 'Caches' if kind == 'cache' else 'Application Support'
+        return os.path.join(home, 'Library', base, 'itf')
+    if kind == 'cache':
+        return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(home, '.cache'), 'itf')
+    return os.path.join(os.environ.get('XDG_CONFIG_HOME') or os.path.join(home, '.config'), 'itf')
+
+
+def natural_sort_key(name):
+    """Ключ естественной сортировки: img2 идет раньше img10"""
+    return [int(part) if part.isdigit() else part.lower()
+            for part in re.split(r'(\d+)', name)]
+
+
+def path_key(path):
+    """Путь для сравнения: C:/a/b.png из диалога и C:/a\\b.png из scandir - один файл"""
+    return os.path.normcase(os.path.abspath(path))
+
+
+def image_bytes(image):
+    """Примерный объем памяти под пиксели изображения"""
+    if image is None:
+        return 0
+    return image.width * image.height * len(image.getbands())
+
+
+def reduction_factor(size, bands, budget_bytes):
+    """Во сколько раз уменьшить каждую сторону, чтобы уложиться в бюджет"""
+    needed = size[0] * size[1] * bands
+    if not budget_bytes or needed <= budget_bytes:
+        return 1
+    return math.ceil(math.sqrt(needed / budget_bytes))
+
+
+_unchecked_open_lock = threading.Lock()
+
+
+def open_unchecked(path):
+    """Открытие без защиты Pillow от "бомб": память ограничивает decode_image"""
+    if hasattr(path, 'seek'):
+        path.seek(0)
+    with _unchecked_open_lock:
+        limit = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = None
+        try:
+            return Image.open(path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
+
+
+def open_image(path):
+    """Image.open, но очень большие файлы не считаются ошибкой.
+    
+    path - путь или файловый объект в памяти (читается с начала).
+    """
+    if hasattr(path, 'seek'):
+        path.seek(0)
+    try:
+        return Image.open(path)
+    except Image.DecompressionBombError:
+        return open_unchecked(path)
+
+
+# Байт на пиксель для несжатых растров, которые умеет читать read_region
+RAW_PIXEL_BYTES = {
+    'L': 1, 'P': 1, 'LA': 2,
+    'RGB': 3, 'BGR': 3,
+    'RGBA': 4, 'BGRA': 4, 'RGBX': 4, 'BGRX': 4, 'CMYK': 4,
+}
+
+
+def read_region(path, box, budget_bytes=None, cache=None):
+    """Чтение только области box = (x0, y0, x1, y1) исходника.
+    
+    Декодируются лишь тайлы (TIFF из нескольких тайлов) или строки (несжатые
+    BMP, TIFF, PPM, TGA), которые пересекают область. Сжатые TIFF (LZW,
+    deflate, JPEG) Pillow отдает одним тайлом libtiff, их и остальные форматы
+    читает decode_region (cache - для декодированного целиком уровня).
+    Возвращает None, если прочитать нельзя.
+    """
+    image = open_image(path)
+    tiles = [tuple(tile) for tile in image.tile]
+    bx0, by0, bx1, by1 = box
+    
+    if len(tiles) > 1:
+        selected = [tile for tile in tiles
+                    if tile[1][0] < bx1 and tile[1][2] > bx0 and tile[1][1] < by1 and tile[1][3] > by0]
+    elif len(tiles) == 1 and tiles[0][0] == 'raw' and tiles[0][1] == (0, 0) + image.size:
+        codec, extents, offset, args = tiles[0]
+        if not isinstance(args, tuple):
+            args = (args, 0, 1)
+        rawmode, stride, ystep = (tuple(args) + (0, 1))[:3]
+        if rawmode not in RAW_PIXEL_BYTES or ystep not in (1, -1):
+            return decode_region(image, box, budget_bytes, cache)
+        stride = stride or image.width * RAW_PIXEL_BYTES[rawmode]
+        
+        # Нужны только строки области; снизу вверх (BMP) они лежат в обратном порядке
+        first_row = by0 if ystep == 1 else image.height - by1
+        selected = [(codec, (0, by0, image.width, by1), offset + first_row * stride,
+                     (rawmode, stride, ystep))]
+    else:
+        return decode_region(image, box, budget_bytes, cache)
+    
+    if not selected:
+        return None
+    
+    ux0 = min(tile[1][0] for tile in selected)
+    uy0 = min(tile[1][1] for tile in selected)
+    ux1 = max(tile[1][2] for tile in selected)
+    uy1 = max(tile[1][3] for tile in selected)
+    image.tile = [(codec, (x0 - ux0, y0 - uy0, x1 - ux0, y1 - uy0), offset, args)
+                  for codec, (x0, y0, x1, y1), offset, args in selected]
+    image._size = (ux1 - ux0, uy1 - uy0)
+    image.load()
+    return image.crop((bx0 - ux0, by0 - uy0, bx1 - ux0, by1 - uy0))
+
+
+def decode_region(image, box, budget_bytes=None, cache=None):
+    """Область box из целиком декодированного исходника.
+    
+    Берется самый подробный уровень (см. image_levels), который помещается в
+    DECODE_HEADROOM бюджетов памяти; если это не полный размер, область
+    получается уменьшенной в той же пропорции. None - не помещается ни один.
+    Если передан cache (BoundedCache), декодированный уровень кладется туда
+    по (путь, уровень), и следующие области вырезаются из него без повторного
+    декодирования.
+    """
+    levels = image_levels(image) or [(None, image.size)]
+    source_width, source_height = levels[0][1]
+    bands = len(image.getbands())
+    for key, (width, height) in levels:
+        if not budget_bytes or width * height * bands <= budget_bytes * DECODE_HEADROOM:
+            break
+    else:
+        return None
+    
+    cache_key = (image.filename, key)
+    decoded = cache.get(cache_key) if cache is not None else None
+    if decoded is None:
+        if key is not None:
+            select_level(image, key)
+        image.load()
+        decoded = image
+        if cache is not None:
+            cache.put(cache_key, decoded)
+    
+    sx = width / source_width
+    sy = height / source_height
+    bx0, by0, bx1, by1 = box
+    return decoded.crop((int(bx0 * sx), int(by0 * sy),
+                       max(int(bx0 * sx) + 1, int(bx1 * sx)),
+                       max(int(by0 * sy) + 1, int(by1 * sy))))
+
+
+def image_levels(image):
+    """Уровни разрешения многоуровневого файла.
+    
+    Пирамидальный TIFF - первая страница и следующие за ней страницы с теми
+    же пропорциями, каждая строго меньше предыдущей взятой (страницы одного
+    размера - это обычный многостраничный документ, а не уровни); ICO и
+    ICNS - размеры иконки. Возвращает список (ключ уровня, (ширина, высота))
+    от большего к меньшему или пустой список.
+    """
+    if image.format == 'ICO':
+        return [(size, size) for size in sorted(image.info.get('sizes', ()), reverse=True)]
+    
+    if image.format == 'ICNS':
+        sizes = sorted(image.info.get('sizes', ()), key=lambda s: s[0] * s[2], reverse=True)
+        return [(size, (size[0] * size[2], size[1] * size[2])) for size in sizes]
+    
+    if image.format == 'TIFF' and getattr(image, 'n_frames', 1) > 1:
+        base_width, base_height = image.size
+        levels = [(0, (base_width, base_height))]
+        for index in range(1, image.n_frames):
+            image.seek(index)
+            width, height = image.size
+            # Служебные страницы (этикетка, обзор) имеют другие пропорции
+            if width < levels[-1][1][0] and abs(width * base_height - height * base_width) <= 0.02 * base_width * height:
+                levels.append((index, (width, height)))
+        image.seek(0)
+        return levels if len(levels) > 1 else []
+    
+    return []
+
+
+def choose_level(levels, target_size=None):
+    """Самый маленький уровень, который не меньше target_size (иначе - самый большой)"""
+    if target_size:
+        suitable = [level for level in levels
+                    if level[1][0] >= target_size[0] and level[1][1] >= target_size[1]]
+        if suitable:
+            return suitable[-1][0]
+    return levels[0][0]
+
+
+def select_level(image, key):
+    """Переключение файла на уровень key (до декодирования)"""
+    if image.format == 'ICO':
+        image.size = key
+    elif image.format == 'ICNS':
+        image.best_size = key
+        image.size = (key[0] * key[2], key[1] * key[2])
+    else:
+        image.seek(key)
+
+
+class ColorManager:
+    """Перевод изображений из встроенного ICC-профиля в профиль экрана.
+    
+    Преобразование ImageCms строится один раз на сочетание (профиль
+    исходника, профиль экрана, режим) и переиспользуется для всех
+    изображений с тем же профилем. Применяется к рабочей копии один раз при
+    загрузке (в фоновом потоке), а не при каждой перерисовке. Если
+    преобразование ничего не меняет (встроенный sRGB на sRGB-экране, даже
+    если профили записаны по-разному), перевод пропускается.
+    """
+    # Режим исходника -> режим результата
+    OUTPUT_MODES = {'RGB': 'RGB', 'RGBA': 'RGBA', 'CMYK': 'RGB'}
+    
+    def __init__(self):
+        self.transforms = {}
+        self.lock = threading.Lock()
+        self.display = None
+        self.display_key = None
+        self.stats = {'hits': 0, 'builds': 0, 'identity': 0}
+    
+    def display_profile(self):
+        """Профиль экрана (системный, если Pillow умеет его получить, иначе sRGB)"""
+        with self.lock:
+            if self.display is None:
+                profile = None
+                try:
+                    profile = ImageCms.get_display_profile()
+                except Exception as e:
+                    print(f"Профиль экрана недоступен: {e}")
+                if profile is None:
+                    profile = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB'))
+                self.display = profile
+                self.display_key = hashlib.sha1(profile.tobytes()).hexdigest()
+            return self.display, self.display_key
+    
+    def transform_for(self, icc, mode):
+        """Готовое преобразование из кэша или новое (None - профиль не подходит)"""
+        display, display_key = self.display_profile()
+        key = (hashlib.sha1(icc).hexdigest(), display_key, mode)
+        with self.lock:
+            if key in self.transforms:
+                self.stats['hits'] += 1
+                return self.transforms[key]
+            
+            try:
+                source = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+                # Без внутреннего кэша пикселя преобразование можно делить между потоками
+                transform = ImageCms.buildTransform(source, display, mode, self.OUTPUT_MODES[mode],
+                                                    flags=ImageCms.Flags.NOCACHE)
+                if self.is_identity(transform, mode):
+                    self.stats['identity'] += 1
+                    transform = None
+            except Exception as e:
+                print(f"Ошибка ICC-профиля: {e}")
+                transform = None
+            self.transforms[key] = transform
+            self.stats['builds'] += 1
+            return transform
+    
+    def is_identity(self, transform, mode):
+        """Преобразование оставляет цвета как есть (с точностью до единицы).
+        
+        Сравнивать профили по байтам нельзя: одинаковый sRGB бывает с разными
+        описаниями, датами и кривыми в виде таблицы или формулы. Поэтому
+        преобразование проверяется на сетке цветов - один раз на профиль.
+        """
+        if self.OUTPUT_MODES[mode] != mode:
+            return False
+        values = range(0, 256, 15)
+        grid = bytes(v for r in values for g in values for b in values for v in (r, g, b))
+        sample = Image.frombytes('RGB', (len(grid) // 3, 1), grid).convert(mode)
+        converted = ImageCms.applyTransform(sample, transform)
+        return all(high <= 1 for low, high in ImageChops.difference(sample, converted).getextrema())
+    
+    def convert(self, image, icc):
+        """Изображение в профиле экрана (или оно само, если переводить не нужно)"""
+        if not icc or image.mode not in self.OUTPUT_MODES:
+            return image
+        transform = self.transform_for(icc, image.mode)
+        if transform is None:
+            return image
+        return ImageCms.applyTransform(image, transform)
+
+
+def decode_image(path, budget_bytes=None, target_size=None, level=None, color=None):
+    """Открытие и декодирование изображения с ограничением памяти.
+    
+    Возвращает словарь: image - рабочая копия, source_size - размер исходника,
+    warning - текст предупреждения, если копия уменьшена из-за памяти. Если
+    изображение не помещается даже в DECODE_HEADROOM бюджетов, выбрасывает
+    ValueError.
+    
+    У многоуровневых файлов (см. image_levels) декодируется один уровень:
+    level или самый маленький, которого хватает для target_size. Список
+    уровней и выбранный уровень возвращаются в levels и level.
+    
+    Если передан color (ColorManager), рабочая копия переводится из
+    встроенного ICC-профиля в профиль экрана; icc - профиль исходника,
+    если перевод был. Без color пиксели не меняются, а icc - встроенный
+    профиль исходника (для сохранения).
+    """
+    image = open_image(path)
+    levels = image_levels(image)
+    source_size = levels[0][1] if levels else image.size
+    if levels:
+        if level is None:
+            level = choose_level(levels, target_size)
+        select_level(image, level)
+    level_size = image.size
+    icc = image.info.get('icc_profile')
+    bands = len(image.getbands())
+    
+    factor = reduction_factor(image.size, bands, budget_bytes)
+    if factor > 1:
+        # JPEG сразу декодируется в уменьшенном размере
+        image.draft(image.mode, (image.width // factor, image.height // factor))
+        decode_bytes = image.width * image.height * bands
+        if decode_bytes > budget_bytes * DECODE_HEADROOM:
+            raise ValueError(
+                f"Изображение {level_size[0]}×{level_size[1]} слишком большое: "
+                f"для открытия нужно около {decode_bytes // (1024 * 1024)} МБ памяти "
+                f"при бюджете {budget_bytes // (1024 * 1024)} МБ")
+    
+    image.load()
+    
+    factor = reduction_factor(image.size, bands, budget_bytes)
+    if factor > 1:
+        image = image.reduce(factor)
+    
+    warning = None
+    if image.size != level_size:
+        warning = (f"Изображение {level_size[0]}×{level_size[1]} больше бюджета памяти "
+                   f"({budget_bytes // (1024 * 1024)} МБ), показана копия {image.width}×{image.height}")
+    
+    if color is not None:
+        converted = color.convert(image, icc)
+        if converted is image:
+            icc = None
+        image = converted
+    return {'image': image, 'source_size': source_size, 'warning': warning,
+            'levels': levels, 'level': level, 'icc': icc}
+
+
+def decode_export(path, target_size, budget_bytes=None):
+    """Чтение исходника для сохранения в размере target_size.
+    
+    Декодируется самый маленький уровень многоуровневого файла (у JPEG -
+    самый маленький масштаб декодирования), которого хватает для
+    target_size, без уменьшения под бюджет и без перевода цвета. Если для
+    этого нужно больше DECODE_HEADROOM бюджетов памяти, выбрасывает
+    ValueError. Возвращает словарь с image и icc (профиль исходника).
+    """
+    image = open_image(path)
+    levels = image_levels(image)
+    if levels:
+        select_level(image, choose_level(levels, target_size))
+    image.draft(image.mode, target_size)
+    
+    decode_bytes = image.width * image.height * len(image.getbands())
+    if budget_bytes and decode_bytes > budget_bytes * DECODE_HEADROOM:
+        raise ValueError(
+            f"Для сохранения в размере {target_size[0]}×{target_size[1]} нужно прочитать исходник "
+            f"{image.width}×{image.height} - около {decode_bytes // (1024 * 1024)} МБ памяти "
+            f"при бюджете {budget_bytes // (1024 * 1024)} МБ")
+    
+    image.load()
+    return {'image': image, 'icc': image.info.get('icc_profile')}
+
+
+def scale_bitmap(image, width, height):
+    """Уменьшенная/увеличенная копия изображения (или оно само, если размер совпадает)"""
+    if (width, height) == image.size:
+        return image
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+class BoundedCache:
+    """Потокобезопасный LRU-кэш с ограничением числа элементов"""
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+    
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+    
+    def pop(self, key):
+        with self.lock:
+            return self.items.pop(key, None)
+    
+    def values(self):
+        with self.lock:
+            return list(self.items.values())
+    
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.items
+    
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class ImageComparer:
+    """Сравнение текущего изображения со вторым (эталоном).
+    
+    Для каждого размера битмапа оба входа приводятся к RGB нужного размера
+    один раз и кэшируются вместе с картой разницы. Ползунок смешивания
+    пересчитывает только итоговую смесь: Image.blend и ImageChops
+    обрабатывают весь буфер сразу, без попиксельного цикла в Python.
+    """
+    def __init__(self):
+        self.path = None
+        self.reference = None
+        self.mode = 'off'
+        self.factor = 0.5
+        self.scaled = BoundedCache(COMPARE_CACHE_ITEMS)
+        self.inputs = BoundedCache(COMPARE_CACHE_ITEMS)
+    
+    @property
+    def active(self):
+        return self.reference is not None and self.mode != 'off'
+    
+    def set_reference(self, path, image):
+        self.path = path
+        self.reference = image
+        self.scaled.clear()
+        self.inputs.clear()
+        if self.mode == 'off':
+            self.mode = 'blend'
+    
+    def clear(self):
+        self.path = None
+        self.reference = None
+        self.mode = 'off'
+        self.scaled.clear()
+        self.inputs.clear()
+    
+    def prepare(self, bitmap):
+        """Буферы сравнения для битмапа текущего изображения (готовые - из кэша)"""
+        key = (id(bitmap), bitmap.size)
+        entry = self.inputs.get(key)
+        if entry is not None and entry['source'] is bitmap:
+            return entry
+        
+        # Эталон масштабируется под размер один раз, даже если битмап сменился
+        other = self.scaled.get(bitmap.size)
+        if other is None:
+            other = scale_bitmap(self.reference, *bitmap.size).convert('RGB')
+            self.scaled.put(bitmap.size, other)
+        
+        entry = {'source': bitmap, 'base': bitmap.convert('RGB'), 'other': other, 'difference': None}
+        self.inputs.put(key, entry)
+        return entry
+    
+    def snapshot(self):
+        """Параметры сравнения для фоновой перерисовки (None - сравнение выключено)"""
+        if not self.active:
+            return None
+        return (id(self.reference), self.mode, self.factor)
+    
+    def compose(self, bitmap, mode=None, factor=None):
+        """Итоговый битмап сравнения того же размера, что и bitmap"""
+        mode = mode or self.mode
+        factor = self.factor if factor is None else factor
+        entry = self.prepare(bitmap)
+        base, other = entry['base'], entry['other']
+        
+        if mode == 'blend':
+            return Image.blend(base, other, factor)
+        
+        if mode == 'difference':
+            # Карта разницы не зависит от ползунка - считаем один раз
+            if entry['difference'] is None:
+                entry['difference'] = ImageChops.difference(base, other)
+            return Image.blend(base, entry['difference'], factor)
+        
+        # Шторка: слева текущее изображение, справа эталон
+        split = int(base.width * factor)
+        result = base.copy()
+        result.paste(other.crop((split, 0, base.width, base.height)), (split, 0))
+        return result
+
+
+class AdjustmentPipeline:
+    """Неразрушающая коррекция битмапов превью и окна поверх экрана.
+    
+    Шаги применяются по порядку STAGES; шаги со значениями по умолчанию
+    пропускаются. Результат каждого шага кэшируется по битмапу и параметрам
+    всех шагов до него включительно, поэтому изменение одного ползунка
+    пересчитывает только шаги начиная с него. Яркость, контраст, инверсия и
+    оттенок - таблицы подстановки (Image.point), без цикла по пикселям.
+    """
+    STAGES = (
+        ('grayscale', ('grayscale',)),
+        ('brightness', ('brightness',)),
+        ('contrast', ('contrast',)),
+        ('invert', ('invert',)),
+        ('tint', ('tint', 'tint_color')),
+    )
+    
+    def __init__(self, max_items=ADJUSTMENT_CACHE_ITEMS):
+        self.params = dict(ADJUSTMENT_DEFAULTS)
+        self.cache = BoundedCache(max_items)
+        self.stats = {'cached': 0, 'computed': 0}
+    
+    @property
+    def active(self):
+        return bool(self.stages())
+    
+    def update(self, values):
+        """Изменение параметров (неизвестные ключи игнорируются)"""
+        for name, value in values.items():
+            if name in self.params:
+                self.params[name] = value
+    
+    def reset(self):
+        self.params = dict(ADJUSTMENT_DEFAULTS)
+    
+    def stages(self):
+        """Шаги, которые что-то меняют: ((имя, значения параметров), ...)"""
+        stages = []
+        for name, keys in self.STAGES:
+            values = tuple(self.params[key] for key in keys)
+            if values[0] != ADJUSTMENT_DEFAULTS[keys[0]]:
+                stages.append((name, values))
+        return tuple(stages)
+    
+    def apply(self, bitmap, stages=None):
+        """Скорректированный битмап (сам bitmap, если коррекция не задана)
+        
+        stages - снимок параметров (stages()) для фоновой перерисовки.
+        """
+        if stages is None:
+            stages = self.stages()
+        if not stages:
+            return bitmap
+        
+        # Начинаем с самого длинного уже посчитанного префикса шагов
+        image, done = None, 0
+        for count in range(len(stages), 0, -1):
+            entry = self.cache.get((id(bitmap), stages[:count]))
+            if entry is not None and entry[0] is bitmap:
+                image, done = entry[1], count
+                break
+        self.stats['cached'] += done
+        
+        if image is None:
+            image = bitmap if bitmap.mode in ('RGB', 'RGBA') else bitmap.convert(
+                'RGBA' if 'transparency' in bitmap.info or 'A' in bitmap.getbands() else 'RGB')
+        
+        for count in range(done + 1, len(stages) + 1):
+            name, values = stages[count - 1]
+            image = getattr(self, 'stage_' + name)(image, *values)
+            self.cache.put((id(bitmap), stages[:count]), (bitmap, image))
+            self.stats['computed'] += 1
+        return image
+    
+    @staticmethod
+    def lookup(image, table):
+        """Одна таблица для цветовых каналов; альфа-канал не меняется"""
+        tables = table * 3
+        if image.mode == 'RGBA':
+            tables += list(range(256))
+        return image.point(tables)
+    
+    def stage_grayscale(self, image, enabled):
+        if image.mode == 'RGBA':
+            return image.convert('LA').convert('RGBA')
+        return image.convert('L').convert('RGB')
+    
+    def stage_brightness(self, image, percent):
+        factor = percent / 100.0
+        return self.lookup(image, [min(255, int(v * factor)) for v in range(256)])
+    
+    def stage_contrast(self, image, percent):
+        factor = percent / 100.0
+        return self.lookup(image, [max(0, min(255, int(128 + (v - 128) * factor))) for v in range(256)])
+    
+    def stage_invert(self, image, enabled):
+        return self.lookup(image, [255 - v for v in range(256)])
+    
+    def stage_tint(self, image, percent, color):
+        strength = percent / 100.0
+        rgb = [int(color[i:i + 2], 16) for i in (1, 3, 5)]
+        tables = []
+        for channel in rgb:
+            tables += [int(v + (channel - v) * strength) for v in range(256)]
+        if image.mode == 'RGBA':
+            tables += list(range(256))
+        return image.point(tables)
+
+
+class RenderCancelled(Exception):
+    """Задача устарела: для той же цели поставлена более новая"""
+
+
+class RenderScheduler:
+    """Фоновая обработка изображений с поколениями по целям.
+    
+    Цель - то, куда попадет результат (превью, окно поверх экрана,
+    сохраняемый файл). Каждая новая задача для цели увеличивает ее
+    поколение: устаревшие задачи выбрасываются до начала работы, а начатые
+    прерываются на ближайшей проверке check(). Результат передается в поток
+    интерфейса через deliver (call_in_ui) и применяется, только если задача
+    все еще самая новая для своей цели.
+    """
+    def __init__(self, deliver, workers=RENDER_WORKERS):
+        self.deliver = deliver
+        self.workers = workers
+        self.tasks = queue.Queue()
+        self.generations = {}
+        self.threads = []
+        self.lock = threading.Lock()
+        self.stats = {'submitted': 0, 'completed': 0, 'dropped': 0, 'cancelled': 0, 'failed': 0}
+    
+    def submit(self, target, func, args=(), on_done=None, on_error=None):
+        """Задача func(check, *args); предыдущие задачи той же цели устаревают"""
+        with self.lock:
+            generation = self.generations.get(target, 0) + 1
+            self.generations[target] = generation
+            self.stats['submitted'] += 1
+            
+            # Потоки запускаются по мере надобности
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.worker_loop,
+                                          name=f"itf-render-{len(self.threads)}", daemon=True)
+                self.threads.append(thread)
+                thread.start()
+        
+        self.tasks.put((target, generation, func, args, on_done, on_error))
+        return generation
+    
+    def cancel(self, target):
+        """Все поставленные задачи цели устаревают"""
+        with self.lock:
+            self.generations[target] = self.generations.get(target, 0) + 1
+    
+    def is_current(self, target, generation):
+        with self.lock:
+            return self.generations.get(target) == generation
+    
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+    
+    def worker_loop(self):
+        while True:
+            task = self.tasks.get()
+            target, generation = task[:2]
+            if not self.is_current(target, generation):
+                self.count('dropped')
+                continue
+            
+            def check():
+                if not self.is_current(target, generation):
+                    raise RenderCancelled()
+            
+            try:
+                result, error = task[2](check, *task[3]), None
+            except RenderCancelled:
+                self.count('cancelled')
+                continue
+            except Exception as e:
+                result, error = None, e
+            self.deliver(self.complete, task, result, error)
+    
+    def complete(self, task, result, error):
+        """Применение результата (в потоке интерфейса)"""
+        target, generation, func, args, on_done, on_error = task
+        if not self.is_current(target, generation):
+            self.count('dropped')
+            return
+        
+        if error is not None:
+            self.count('failed')
+            if on_error:
+                on_error(error)
+            else:
+                print(f"Ошибка фоновой обработки ({target}): {error}")
+            return
+        
+        self.count('completed')
+        if on_done:
+            on_done(result)
+    
+    def snapshot(self):
+        """Счетчики задач и глубина очереди"""
+        with self.lock:
+            stats = dict(self.stats)
+        stats['queued'] = self.tasks.qsize()
+        stats['pending'] = stats['submitted'] - sum(stats[name] for name in
+                                                    ('completed', 'dropped', 'cancelled', 'failed'))
+        return stats
+
+
+class ImageStore:
+    """Текущее изображение с бюджетом памяти.
+    
+    Изображение больше бюджета хранится уменьшенной рабочей копией; для
+    сохранения в полном размере исходник заново читается с диска. Учитывает
+    память рабочей копии и производных битмапов (превью, окно поверх экрана).
+    """
+    def __init__(self, budget_bytes=MEMORY_BUDGET_MB * 1024 * 1024):
+        self.budget_bytes = budget_bytes
+        self.path = None
+        self.image = None
+        self.source_size = None
+        self.warning = None
+        self.levels = []
+        self.level = None
+        self.icc = None
+        self.target_size = PREVIEW_DEFAULT_SIZE
+        self.color = ColorManager()
+        self.buffers = {}
+        self.shared = {}
+        self.region_source = BoundedCache(1)
+        self.peak_bytes = 0
+    
+    def decode(self, path, level=None):
+        """Декодирование с текущим бюджетом (можно вызывать из любого потока).
+        
+        Из многоуровневых файлов берется уровень, достаточный для target_size;
+        цвета переводятся в профиль экрана.
+        """
+        return decode_image(path, self.budget_bytes, self.target_size, level, self.color)
+    
+    def set(self, path, decoded):
+        """Установка загруженного изображения текущим"""
+        self.path = path
+        self.image = decoded['image']
+        self.source_size = decoded.get('source_size') or self.image.size
+        self.warning = decoded.get('warning')
+        self.levels = decoded.get('levels') or []
+        self.level = decoded.get('level')
+        self.icc = decoded.get('icc')
+        self.buffers = {}
+        self.region_source.clear()
+        self.track('working', self.image)
+    
+    def clear(self):
+        self.path = None
+        self.image = None
+        self.source_size = None
+        self.warning = None
+        self.levels = []
+        self.level = None
+        self.icc = None
+        self.buffers = {}
+        self.region_source.clear()
+    
+    def track(self, name, image):
+        """Учет памяти производного битмапа"""
+        if image is None or image is self.image and name != 'working':
+            self.buffers.pop(name, None)
+        else:
+            self.buffers[name] = image_bytes(image)
+        self.peak_bytes = max(self.peak_bytes, self.current_bytes())
+    
+    def charge(self, name, nbytes):
+        """Учет памяти, которая не зависит от текущего изображения (подгрузка папки)"""
+        self.shared[name] = nbytes
+        self.peak_bytes = max(self.peak_bytes, self.current_bytes())
+    
+    def current_bytes(self):
+        return sum(list(self.buffers.values())) + sum(list(self.shared.values()))
+    
+    def available_bytes(self):
+        return self.budget_bytes - self.current_bytes()
+    
+    @property
+    def downsampled(self):
+        return self.image is not None and self.source_size != self.image.size
+    
+    def export_source(self, target_size):
+        """Чтение исходника для сохранения или None, если годится рабочая копия.
+        
+        Копия в профиле экрана или копия меньше target_size не сохраняется:
+        исходник читается заново (см. decode_export) - в самом маленьком
+        достаточном размере, без перевода цвета, со своим профилем и в
+        пределах бюджета памяти. Путь берется сейчас - к началу фоновой
+        записи может быть открыт уже другой файл.
+        """
+        if not self.icc and (not self.downsampled or (self.image.width >= target_size[0]
+                                                      and self.image.height >= target_size[1])):
+            return None
+        return functools.partial(decode_export, self.path, target_size, self.budget_bytes)
+    
+    def read_region(self, box):
+        """Область исходника (см. read_region) в профиле экрана.
+        
+        Уровень, декодированный целиком ради области, остается для следующих
+        областей, пока помещается в свободную часть бюджета памяти.
+        """
+        region = read_region(self.path, box, self.budget_bytes, self.region_source)
+        sources = self.region_source.values()
+        self.track('region_source', None)
+        if sources and image_bytes(sources[0]) > self.available_bytes():
+            self.region_source.clear()
+        else:
+            self.track('region_source', sources[0] if sources else None)
+        if region is not None:
+            region = self.color.convert(region, self.icc)
+        return region
+    
+    def level_index(self):
+        """(номер текущего уровня с 1 от большего, всего уровней) или None"""
+        for index, (key, size) in enumerate(self.levels):
+            if key == self.level:
+                return index + 1, len(self.levels)
+        return None
+    
+    def better_level(self, target_size):
+        """Уровень крупнее текущего, если текущего не хватает для target_size"""
+        if not self.levels or self.image is None:
+            return None
+        if self.image.width >= target_size[0] and self.image.height >= target_size[1]:
+            return None
+        level = choose_level(self.levels, target_size)
+        current = dict(self.levels).get(self.level)
+        if level == self.level or current and dict(self.levels)[level][0] <= current[0]:
+            return None
+        return level
+    
+    def memory_text(self):
+        mb = 1024 * 1024
+        return f"память {self.current_bytes() / mb:.0f} МБ, пик {self.peak_bytes / mb:.0f} МБ"
+
+
+class SettingsStore:
+    """Настройки и сессия программы в папке пользователя.
+    
+    Запись откладывается на delay секунд и выполняется одним фоновым
+    потоком; частые изменения (ползунки) только сдвигают срок записи.
+    Файл пишется через уникальный временный файл и os.replace, а записи из
+    фонового потока и flush() при закрытии не идут одновременно, так что
+    файл не бывает недописанным.
+    """
+    def __init__(self, path, delay=SETTINGS_SAVE_DELAY):
+        self.path = path
+        self.delay = delay
+        self.data = {}
+        self.lock = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.due = None
+        self.writer = None
+    
+    def load(self, legacy_path=None):
+        """Чтение настроек (при первом запуске - из старого settings.json)"""
+        for path in (self.path, legacy_path):
+            if path and os.path.exists(path):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        self.data = json.load(f)
+                    return self.data
+                except (OSError, ValueError) as e:
+                    print(f"Ошибка загрузки настроек: {e}")
+        return self.data
+    
+    def update(self, values):
+        """Изменение настроек с отложенной записью"""
+        with self.lock:
+            self.data.update(values)
+            self.due = time.monotonic() + self.delay
+            if not self.writer:
+                self.writer = threading.Thread(target=self.write_loop, name="itf-settings", daemon=True)
+                self.writer.start()
+            self.lock.notify()
+    
+    def write_loop(self):
+        while True:
+            with self.lock:
+                while self.due is None:
+                    self.lock.wait()
+                wait = self.due - time.monotonic()
+                if wait > 0:
+                    # Срок мог сдвинуться, пока ждали - проверяем заново
+                    self.lock.wait(wait)
+                    continue
+            self.flush()
+    
+    def flush(self):
+        """Немедленная запись на диск"""
+        with self.write_lock:
+            with self.lock:
+                self.due = None
+                data = dict(self.data)
+            
+            data['last_saved'] = datetime.now().isoformat()
+            folder = os.path.dirname(self.path)
+            tmp_path = None
+            try:
+                os.makedirs(folder, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='settings-', suffix='.tmp')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Ошибка сохранения настроек: {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+
+
+class DiskBitmapCache:
+    """Кэш готовых битмапов на диске (превью, миниатюры, окно поверх экрана).
+    
+    Ключ - путь, размер и время изменения исходного файла. Битмапы хранятся
+    несжатыми: прочитать их быстрее, чем декодировать исходник. Запись идет
+    в фоновом потоке; при превышении лимита удаляются давно не использованные.
+    """
+    # ITF2 - битмапы уже в профиле экрана (ITF1 без управления цветом не читаем)
+    MAGIC = b'ITF2'
+    
+    def __init__(self, folder, max_bytes=DISK_CACHE_MAX_MB * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.total_bytes = None
+        self.tasks = queue.Queue()
+        self.writer = None
+    
+    def key(self, path, variant):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        raw = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|{variant}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    
+    def file_for(self, key):
+        return os.path.join(self.folder, key + '.raw')
+    
+    def get(self, path, variant):
+        """Битмап из кэша или None"""
+        key = self.key(path, variant)
+        if not key:
+            return None
+        
+        file_name = self.file_for(key)
+        try:
+            with open(file_name, 'rb') as f:
+                magic, mode, width, height = f.readline().split()
+                data = f.read()
+            if magic != self.MAGIC:
+                return None
+            mode = mode.decode('ascii')
+            image = Image.frombuffer(mode, (int(width), int(height)), data, 'raw', mode, 0, 1)
+            # Отметка использования для вытеснения
+            os.utime(file_name)
+            return image
+        except (OSError, ValueError):
+            return None
+    
+    def put(self, path, variant, image, max_size=None):
+        """Сохранение битмапа (в фоне); max_size - уменьшить до этого размера"""
+        key = self.key(path, variant)
+        if not key:
+            return
+        self.tasks.put((key, image, max_size))
+        if not self.writer:
+            self.writer = threading.Thread(target=self.write_loop, name="itf-disk-cache", daemon=True)
+            self.writer.start()
+    
+    def write_loop(self):
+        while True:
+            key, image, max_size = self.tasks.get()
+            try:
+                self.write(key, image, max_size)
+            except Exception as e:
+                print(f"Ошибка записи кэша: {e}")
+    
+    def write(self, key, image, max_size):
+        if max_size and (image.width > max_size[0] or image.height > max_size[1]):
+            image = image.copy()
+            image.thumbnail(max_size, Image.Resampling.LANCZOS)
+        if image.mode not in ('RGB', 'RGBA', 'L'):
+            image = image.convert('RGBA')
+        
+        os.makedirs(self.folder, exist_ok=True)
+        file_name = self.file_for(key)
+        tmp_name = file_name + '.tmp'
+        header = b'%s %s %d %d\n' % (self.MAGIC, image.mode.encode('ascii'), image.width, image.height)
+        with open(tmp_name, 'wb') as f:
+            f.write(header)
+            f.write(image.tobytes())
+        
+        old_size = os.path.getsize(file_name) if os.path.exists(file_name) else 0
+        os.replace(tmp_name, file_name)
+        
+        if self.total_bytes is None:
+            self.total_bytes = sum(size for _, size, _ in self.entries())
+        else:
+            self.total_bytes += os.path.getsize(file_name) - old_size
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+    
+    def entries(self):
+        """(время использования, размер, путь) для всех файлов кэша"""
+        result = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.name.endswith('.raw'):
+                    st = entry.stat()
+                    result.append((st.st_mtime, st.st_size, entry.path))
+        return result
+    
+    def evict(self):
+        """Удаление давно не использованных битмапов до 90% лимита"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, file_name in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(file_name)
+                total -= size
+            except OSError:
+                pass
+        self.total_bytes = total
+
+
+class FolderSlideshow:
+    """Листание папки с изображениями с фоновой подгрузкой соседних файлов.
+    
+    Список файлов читается в отдельном потоке порциями и сразу сортируется.
+    Соседние файлы декодируются и масштабируются заранее в ограниченный кэш;
+    смена папки или направления листания отменяет начатую подгрузку. Для
+    папки одиночного файла соседи подгружаются только с первого шага. Если
+    передан store (ImageStore), память кэша учитывается в его бюджете, и
+    файл, который в свободную часть бюджета не помещается, не кэшируется.
+    """
+    def __init__(self, on_update=None, prefetch=SLIDESHOW_PREFETCH, decoder=decode_image, store=None):
+        self.on_update = on_update
+        self.decoder = decoder
+        self.store = store
+        self.prefetch = prefetch
+        self.cache = BoundedCache(prefetch * 2 + 2)
+        self.lock = threading.Condition()
+        self.folder = None
+        self.entries = []
+        self.listing_done = False
+        self.current = None
+        self.direction = 1
+        self.preview_scale = 1.0
+        self.generation = 0
+        self.prefetch_generation = 0
+        self.plan = []
+        self.active = False
+        self.worker = None
+    
+    def open(self, folder, current=None, preview_scale=1.0, active=False):
+        """Начало просмотра папки.
+        
+        active - папку открыли явно, соседей подгружаем сразу; иначе (открыт
+        один файл) - только после первого шага.
+        """
+        with self.lock:
+            self.active = active
+            self.preview_scale = preview_scale
+            self.generation += 1
+            self.prefetch_generation += 1
+            self.folder = folder
+            self.entries = []
+            self.listing_done = False
+            self.current = current
+            self.plan = []
+            self.cache.clear()
+            generation = self.generation
+        self.charge()
+        
+        threading.Thread(target=self.list_folder, args=(folder, generation),
+                         name="itf-listing", daemon=True).start()
+        if not self.worker:
+            self.worker = threading.Thread(target=self.prefetch_loop,
+                                           name="itf-prefetch", daemon=True)
+            self.worker.start()
+    
+    def close(self):
+        """Выход из режима папки"""
+        with self.lock:
+            self.generation += 1
+            self.prefetch_generation += 1
+            self.folder = None
+            self.entries = []
+            self.current = None
+            self.active = False
+            self.plan = []
+            self.cache.clear()
+        self.charge()
+    
+    def take(self, path):
+        """Подгруженный файл (из кэша он уходит - дальше это рабочая копия)"""
+        entry = self.cache.pop(path)
+        self.charge()
+        return entry
+    
+    def charge(self):
+        if self.store is not None:
+            self.store.charge('slideshow', sum(image_bytes(entry['image']) + image_bytes(entry['preview'])
+                                               for entry in self.cache.values()))
+    
+    def list_folder(self, folder, generation):
+        batch = []
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if generation != self.generation:
+                        return
+                    if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                        batch.append((natural_sort_key(entry.name), path_key(entry.path), entry.path))
+                    if len(batch) >= 64:
+                        self.add_entries(batch, generation)
+                        batch = []
+        except OSError as e:
+            print(f"Ошибка чтения папки: {e}")
+        self.add_entries(batch, generation, done=True)
+    
+    def add_entries(self, batch, generation, done=False):
+        with self.lock:
+            if generation != self.generation:
+                return
+            for item in batch:
+                bisect.insort(self.entries, item)
+            self.listing_done = done
+            self.update_plan()
+        if self.on_update:
+            self.on_update()
+    
+    def index_of(self, path):
+        """Позиция файла в отсортированном списке (вызывать под lock)"""
+        if path is None:
+            return None
+        item = (natural_sort_key(os.path.basename(path)), path_key(path))
+        i = bisect.bisect_left(self.entries, item)
+        if i < len(self.entries) and self.entries[i][:2] == item:
+            return i
+        return None
+    
+    def is_current(self, path):
+        """path - текущий файл папки (в любой записи пути)"""
+        with self.lock:
+            return path is not None and self.current is not None and path_key(path) == path_key(self.current)
+    
+    def position(self):
+        """(номер текущего файла с 1, всего файлов)"""
+        with self.lock:
+            i = self.index_of(self.current)
+            return (i + 1 if i is not None else 0), len(self.entries)
+    
+    def step(self, direction, preview_scale=1.0):
+        """Переход к соседнему файлу, возвращает его путь"""
+        with self.lock:
+            if not self.entries:
+                return None
+            
+            i = self.index_of(self.current)
+            if i is None:
+                i = 0 if direction > 0 else len(self.entries) - 1
+            else:
+                i = (i + direction) % len(self.entries)
+            
+            # Разворот или смена масштаба - подгруженное в старую сторону уже не нужно
+            if direction != self.direction or preview_scale != self.preview_scale:
+                self.prefetch_generation += 1
+            self.direction = direction
+            self.preview_scale = preview_scale
+            self.active = True
+            self.current = self.entries[i][2]
+            self.update_plan()
+            return self.current
+    
+    def update_plan(self):
+        """Очередь подгрузки: сначала по направлению листания (вызывать под lock)"""
+        i = self.index_of(self.current)
+        if i is None or not self.active:
+            self.plan = []
+            return
+        
+        count = len(self.entries)
+        plan = []
+        for direction in (self.direction, -self.direction):
+            for k in range(1, self.prefetch + 1):
+                j = (i + direction * k) % count
+                if j == i:
+                    continue
+                path = self.entries[j][2]
+                if path not in plan and path not in self.cache:
+                    plan.append(path)
+        self.plan = plan
+        self.lock.notify_all()
+    
+    def prefetch_loop(self):
+        while True:
+            with self.lock:
+                while not self.plan:
+                    self.lock.wait()
+                path = self.plan.pop(0)
+                generation = self.prefetch_generation
+                scale = self.preview_scale
+            
+            try:
+                entry = self.decoder(path)
+                if generation != self.prefetch_generation:
+                    continue
+                image = entry['image']
+                size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+                entry['preview'] = scale_bitmap(image, *size)
+            except Exception as e:
+                print(f"Ошибка подгрузки {os.path.basename(path)}: {e}")
+                continue
+            
+            if generation != self.prefetch_generation:
+                continue
+            if self.store is not None:
+                entry_bytes = image_bytes(entry['image']) + image_bytes(entry['preview'])
+                if entry_bytes > self.store.available_bytes():
+                    continue
+            self.cache.put(path, entry)
+            self.charge()
+
 
 class ModernToggleSwitch:
     def __init__(self, parent, text="", command=None, width=60, height=30):
@@ -55,24 +1900,214 @@ class ModernToggleSwitch:
         self.canvas.create_text(30, 15, text=state_text, fill=text_color,
                                font=('Segoe UI', 9, 'bold'))
     
-    def toggle(self, event=None):
-        self.state = not self.state
-        self.draw_switch()
-        if self.command:
+    def toggle(self, event=None):
+        self.state = not self.state
+        self.draw_switch()
+        if self.command:
+            try:
+                self.command()
+            except Exception as e:
+                print(f"Error in toggle command: {e}")
+    
+    def get(self):
+        return self.state
+    
+    def set(self, value):
+        self.state = value
+        self.draw_switch()
+
+class WheelRouter:
+    """Единая обработка колесика мыши.
+    
+    Событие получает виджет под курсором (а не весь интерфейс сразу), а
+    серия щелчков за кадр сливается в один вызов обработчика. Понимает
+    <MouseWheel> (Windows, macOS) и <Button-4>/<Button-5> (X11).
+    Обработчик вызывается как handler(steps, x_root, y_root), steps > 0 - от себя.
+    """
+    def __init__(self, root, frame_ms=WHEEL_FRAME_MS):
+        self.root = root
+        self.frame_ms = frame_ms
+        self.handlers = {}
+        self.pending = {}
+        self.after_id = None
+        
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            root.bind_all(sequence, self.on_wheel, add='+')
+    
+    def register(self, widget, handler):
+        """Колесико над widget (и его дочерними виджетами) идет в handler"""
+        self.handlers[str(widget)] = handler
+    
+    def unregister(self, widget):
+        self.handlers.pop(str(widget), None)
+        self.pending.pop(str(widget), None)
+    
+    def target_for(self, x_root, y_root):
+        """Ближайший зарегистрированный виджет под курсором"""
+        try:
+            widget = self.root.winfo_containing(x_root, y_root)
+        except (KeyError, tk.TclError):
+            return None
+        while widget is not None:
+            if str(widget) in self.handlers:
+                return str(widget)
+            widget = widget.master
+        return None
+    
+    def on_wheel(self, event):
+        if event.num == 4:
+            steps = 1
+        elif event.num == 5:
+            steps = -1
+        elif sys.platform == 'darwin':
+            steps = event.delta
+        else:
+            steps = event.delta / 120
+        
+        target = self.target_for(event.x_root, event.y_root)
+        if target is None or not steps:
+            return
+        
+        total = self.pending.get(target, (0, 0, 0))[0] + steps
+        self.pending[target] = (total, event.x_root, event.y_root)
+        if not self.after_id:
+            self.after_id = self.root.after(self.frame_ms, self.flush)
+        return "break"
+    
+    def flush(self):
+        """Передача накопленных за кадр щелчков обработчикам"""
+        self.after_id = None
+        pending, self.pending = self.pending, {}
+        for target, (steps, x_root, y_root) in pending.items():
+            handler = self.handlers.get(target)
+            if handler and steps:
+                handler(steps, x_root, y_root)
+
+
+class Animator:
+    """Плавные переходы значений (прозрачность окна, позже - положение).
+    
+    Все анимации ведет один таймер after с целевой частотой кадров. Значение
+    каждого кадра считается по time.monotonic(), поэтому при задержке
+    (например, пока идет масштабирование) кадры пропускаются, а не копятся.
+    Новая цель для идущей анимации продолжает ее с текущего значения.
+    """
+    def __init__(self, root, fps=ANIMATION_FPS):
+        self.root = root
+        self.frame = 1.0 / fps
+        self.animations = {}
+        self.job = None
+        self.last_tick = None
+        self.stats = {'frames': 0, 'missed': 0}
+    
+    def active(self, key):
+        return key in self.animations
+    
+    def animate(self, key, start, end, duration, apply, on_done=None):
+        """Переход key от start к end за duration секунд; apply(значение) - каждый кадр.
+        
+        Если key уже анимируется, переход начинается с текущего значения, а
+        время сокращается пропорционально оставшемуся пути. Прежний on_done
+        при этом не вызывается.
+        """
+        running = self.animations.get(key)
+        if running is not None:
+            if abs(end - start) > 1e-6:
+                duration *= min(1.0, abs(end - running['value']) / abs(end - start))
+            start = running['value']
+        
+        self.animations[key] = {
+            'start': start,
+            'end': end,
+            'value': start,
+            'began': time.monotonic(),
+            'duration': duration,
+            'apply': apply,
+            'on_done': on_done,
+        }
+        if not self.job:
+            self.job = self.root.after_idle(self.tick)
+    
+    def cancel(self, key):
+        self.animations.pop(key, None)
+    
+    def tick(self):
+        """Один кадр всех анимаций"""
+        self.job = None
+        now = time.monotonic()
+        
+        # Сколько кадров пропущено из-за задержки
+        if self.last_tick is not None:
+            late_frames = int((now - self.last_tick) / self.frame) - 1
+            if late_frames > 0:
+                self.stats['missed'] += late_frames
+        self.last_tick = now
+        self.stats['frames'] += 1
+        
+        for key, animation in list(self.animations.items()):
+            if animation['duration'] > 0:
+                progress = min(1.0, (now - animation['began']) / animation['duration'])
+            else:
+                progress = 1.0
+            
+            # Плавный разгон и торможение
+            eased = progress * progress * (3 - 2 * progress)
+            animation['value'] = animation['start'] + (animation['end'] - animation['start']) * eased
             try:
-                self.command()
-            except Exception as e:
-                print(f"Error in toggle command: {e}")
+                animation['apply'](animation['value'])
+            except tk.TclError:
+                # Окно уже уничтожено
+                progress = 1.0
+            
+            if progress >= 1.0 and self.animations.get(key) is animation:
+                del self.animations[key]
+                if animation['on_done']:
+                    animation['on_done']()
+        
+        if self.animations:
+            # Следующий кадр - через период от начала этого, без накопления
+            spent = time.monotonic() - now
+            self.job = self.root.after(max(1, int((self.frame - spent) * 1000)), self.tick)
+        else:
+            self.last_tick = None
+
+
+class ActionRecorder:
+    """Запись действий пользователя в файл для повтора (itf_replay.py).
     
-    def get(self):
-        return self.state
+    Формат - JSON по строке: первая строка - заголовок (версия, размеры
+    экрана, окна и превью), дальше - действия {'t': секунды от начала,
+    'action': имя, 'args': параметры}. Строки пишутся сразу, поэтому запись
+    не теряется при аварийном завершении.
+    """
+    def __init__(self, path, header):
+        self.path = path
+        self.started = time.monotonic()
+        self.count = 0
+        self.file = open(path, 'w', encoding='utf-8', buffering=1)
+        self.write(dict(header, version=TRACE_VERSION, started=datetime.now().isoformat()))
     
-    def set(self, value):
-        self.state = value
-        self.draw_switch()
+    def write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    
+    def record(self, action, **args):
+        if self.file is None:
+            return
+        try:
+            self.write({'t': round(time.monotonic() - self.started, 4), 'action': action, 'args': args})
+            self.count += 1
+        except (OSError, ValueError) as e:
+            print(f"Ошибка записи действий: {e}")
+            self.close()
+    
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
 
 class ScrollableFrame(ttk.Frame):
-    def __init__(self, container, *args, **kwargs):
+    def __init__(self, container, *args, wheel_router=None, **kwargs):
         super().__init__(container, *args, **kwargs)
         
         # Создаем Canvas и Scrollbar
@@ -95,23 +2130,44 @@ class ScrollableFrame(ttk.Frame):
         self.canvas.pack(side="left", fill="both", expand=True)
         self.scrollbar.pack(side="right", fill="y")
         
-        # Бинд для колесика мыши
-        self.canvas.bind_all("<MouseWheel>", self._on_mousewheel)
+        # Колесико мыши прокручивает панель только когда курсор над ней
+        self._wheel_remainder = 0.0
+        if wheel_router:
+            wheel_router.register(self.canvas, self._on_mousewheel)
         
         # Бинд для обновления прокрутки
         self.scrollable_frame.bind("<Configure>", self._update_scrollregion)
     
-    def _on_mousewheel(self, event):
-        self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
+    def _on_mousewheel(self, steps, x_root, y_root):
+        # Доли щелчка (тачпад) копятся, пока не наберется целая строка
+        self._wheel_remainder -= steps
+        units = int(self._wheel_remainder)
+        if units:
+            self._wheel_remainder -= units
+            self.canvas.yview_scroll(units, "units")
     
     def _update_scrollregion(self, event=None):
         self.canvas.configure(scrollregion=self.canvas.bbox("all"))
 
 class ImageOverlayApp:
-    def __init__(self, root):
+    def __init__(self, root, profiler=None):
         self.root = root
+        self.profiler = profiler or StartupProfiler()
+        self.controls_ready = False
+        self.pending_files = []
+        self.instance_server = None
+        self.control_enabled = False
+        self.batch_depth = 0
+        self.batch_dirty = set()
+        self.ui_queue = queue.Queue()
+        self.ui_wake_lock = threading.Lock()
+        self.ui_wake_pending = False
         self.root.title("Image to Fix Pro")
-        self.root.geometry("1200x700")
+        
+        # Масштаб экрана (96 DPI - 100%). После enable_dpi_awareness Windows
+        # окно не растягивает: шрифты в пунктах Tk масштабирует сам, а
+        # размеры в пикселях - px()
+        self.ui_scale = max(1.0, float(self.root.tk.call('tk', 'scaling')) / (96 / 72))
         
         # Центрируем окно
         self.center_window()
@@ -122,23 +2178,304 @@ class ImageOverlayApp:
         # Инициализация переменных
         self.setup_variables()
         
-        # Настройка интерфейса
+        # Настройка интерфейса (каркас окна, панели настроек строятся позже)
         self.setup_ui()
+        self.profiler.mark("ui_shell")
         
-        # Загрузка настроек
-        self.load_settings()
+        # Листание папки
+        self.root.bind('<Next>', lambda e: self.on_slideshow_key(e, 1))
+        self.root.bind('<Prior>', lambda e: self.on_slideshow_key(e, -1))
+        self.root.bind('<Right>', lambda e: self.on_slideshow_key(e, 1))
+        self.root.bind('<Left>', lambda e: self.on_slideshow_key(e, -1))
+        
+        # Остальное - после того как окно появилось на экране
+        self.root.bind('<Map>', self.on_first_map, add='+')
+        self.root.after(500, self.finish_startup)
+        
+        # Задачи из фоновых потоков - по событию, без опроса очереди по таймеру
+        self.root.bind('<<ui-queue>>', lambda e: self.process_ui_queue())
+    
+    def on_first_map(self, event):
+        """Первое появление главного окна"""
+        if event.widget is not self.root or self.profiler.elapsed("window_visible") is not None:
+            return
+        self.profiler.mark("window_visible")
+        self.root.after(1, self.finish_startup)
+    
+    def finish_startup(self):
+        """Отложенная часть запуска: панели, настройки, горячие клавиши"""
+        if self.profiler.reported:
+            return
+        
+        self.ensure_controls()
+        self.profiler.mark("controls")
+        
+        # Горячая клавиша и тяжелые импорты - вне основного потока
+        threading.Thread(target=self.setup_hotkey, name="itf-hotkey", daemon=True).start()
+        threading.Thread(target=self.warm_imports, name="itf-imports", daemon=True).start()
+        
+        summary = self.profiler.report()
+        self.update_status(f"Готов к работе. {summary}" if summary else "Готов к работе")
+        
+        # Файлы из командной строки
+        files, self.pending_files = self.pending_files, []
+        self.open_files(files)
+    
+    def call_in_ui(self, func, *args):
+        """Выполнение функции в потоке Tk, возвращает Future с результатом"""
+        future = Future()
+        self.ui_queue.put((future, func, args))
+        self.wake_ui()
+        return future
+    
+    def wake_ui(self):
+        """Событие для потока Tk, что в очереди есть задачи (одно на пачку задач)"""
+        with self.ui_wake_lock:
+            if self.ui_wake_pending:
+                return
+            self.ui_wake_pending = True
+        try:
+            # Из фонового потока tkinter передает вызов в поток Tk сам;
+            # до запуска mainloop событие ждет в очереди Tk
+            self.root.event_generate('<<ui-queue>>', when='tail')
+        except (RuntimeError, tk.TclError) as e:
+            # Окно уже закрыто или главный цикл так и не запустился
+            print(f"Ошибка передачи задачи в интерфейс: {e}")
+            with self.ui_wake_lock:
+                self.ui_wake_pending = False
+    
+    def process_ui_queue(self):
+        """Выполнение задач, поставленных из фоновых потоков"""
+        # Сброс до разбора: задача, поставленная во время разбора, разбудит снова
+        with self.ui_wake_lock:
+            self.ui_wake_pending = False
+        while True:
+            try:
+                future, func, args = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+    
+    def start_instance_server(self):
+        """Прием файлов от повторных запусков программы"""
+        server = InstanceServer(self.on_instance_message)
+        if server.start():
+            self.instance_server = server
+    
+    def on_instance_message(self, message):
+        """Команда от другого процесса (вызывается в потоке канала)"""
+        if message.get('cmd') == 'open':
+            self.call_in_ui(self.open_files, message.get('files') or [])
+            return {'ok': True}
+        if message.get('cmd') == 'image':
+            if not message.get('data'):
+                return {'ok': False, 'error': "Нет данных изображения"}
+            self.call_in_ui(self.load_image_bytes, message['data'], message.get('name') or "stdin", False)
+            return {'ok': True}
+        if message.get('cmd') == 'batch':
+            if not self.control_enabled:
+                return {'ok': False, 'error': "Управление отключено (запустите с --control)"}
+            future = self.call_in_ui(self.run_batch, message.get('commands') or [])
+            return future.result(timeout=60)
+        return {'ok': False, 'error': f"Неизвестная команда: {message.get('cmd')}"}
+    
+    # Управление из скриптов
+    
+    def begin_batch(self):
+        """Начало пакета изменений: перерисовка откладывается до end_batch"""
+        self.batch_depth += 1
+    
+    def end_batch(self):
+        """Конец пакета: одна перерисовка за все изменения"""
+        self.batch_depth -= 1
+        if self.batch_depth > 0:
+            return
+        
+        dirty, self.batch_dirty = self.batch_dirty, set()
+        if 'overlay' in dirty and self.is_pinned and self.image:
+            self.create_overlay()
+        elif self.overlay_window:
+            if 'position' in dirty:
+                self.move_overlay_to_position()
+            if 'opacity' in dirty:
+                self.set_overlay_alpha(self.opacity_scale.get() / 100.0)
+        if 'preview' in dirty:
+            self.display_preview()
+    
+    def run_batch(self, commands):
+        """Выполнение списка команд управления за одну перерисовку"""
+        self.ensure_controls()
+        results = []
+        self.begin_batch()
+        try:
+            for command in commands:
+                try:
+                    results.append({'ok': True, 'result': self.run_control_command(command)})
+                except Exception as e:
+                    results.append({'ok': False, 'error': str(e)})
+        finally:
+            self.end_batch()
+        return {'ok': all(r['ok'] for r in results), 'results': results}
+    
+    def run_control_command(self, command):
+        """Выполнение одной команды управления"""
+        cmd = command.get('cmd')
+        
+        if cmd == 'load':
+            path = command.get('path', '')
+            if not os.path.isfile(path):
+                raise ValueError(f"Файл не найден: {path}")
+            self.load_image_file(path, show_errors=False, background=False)
+        
+        elif cmd == 'pin':
+            pinned = bool(command.get('on', True))
+            if pinned and not self.image:
+                raise ValueError("Сначала загрузите изображение")
+            if pinned != self.is_pinned:
+                self.toggle_overlay()
+        
+        elif cmd == 'toggle':
+            if not self.image:
+                raise ValueError("Сначала загрузите изображение")
+            self.toggle_overlay()
+        
+        elif cmd == 'move':
+            position = command.get('position', '')
+            if position not in OVERLAY_POSITIONS:
+                raise ValueError(f"Неизвестная позиция: {position}")
+            self.position_var.set(position)
+            if 'monitor' in command:
+                self.monitor_var.set(int(command['monitor']))
+            self.update_position()
+        
+        elif cmd == 'size':
+            width = int(command.get('width', 0))
+            height = int(command.get('height', 0))
+            if width <= 0 or height <= 0:
+                raise ValueError("Размер должен быть положительным числом")
+            self.set_size_fields(width, height)
+            self.batch_dirty.add('overlay')
         
-        # Настройка горячих клавиш
-        self.setup_hotkey()
+        elif cmd == 'reset_size':
+            self.reset_size()
+            self.batch_dirty.add('overlay')
         
-        # Статус
-        self.update_status("Готов к работе")
+        elif cmd == 'opacity':
+            value = int(command.get('value', 100))
+            self.opacity_scale.set(max(10, min(100, value)))
+            self.batch_dirty.add('opacity')
         
+        elif cmd == 'status':
+            pass
+        
+        else:
+            raise ValueError(f"Неизвестная команда: {cmd}")
+        
+        return self.control_status()
+    
+    def control_status(self):
+        """Текущее состояние для ответа скрипту"""
+        return {
+            'image': self.image.size if self.image else None,
+            'pinned': self.is_pinned,
+            'position': self.position_var.get(),
+            'monitor': self.monitor_var.get(),
+            'size': self.get_size_fields(),
+            'opacity': self.opacity_scale.get(),
+            'render': self.scheduler.snapshot(),
+            'animation': dict(self.animator.stats),
+        }
+    
+    def busy(self):
+        """Идет ли еще работа после действия: фон, очередь интерфейса, загрузка, анимации"""
+        render = self.scheduler.snapshot()
+        return bool(render['pending'] or render['queued']
+                    or not self.ui_queue.empty()
+                    or self.loading_path
+                    or self.level_request
+                    or self.refresh_job
+                    or self.drag_data.get('pending')
+                    or self.animator.animations)
+    
+    def start_recording(self, path):
+        """Запись действий в файл path (--record)"""
+        self.root.update_idletasks()
+        header = {
+            'screen': [self.root.winfo_screenwidth(), self.root.winfo_screenheight()],
+            'window': [self.root.winfo_width(), self.root.winfo_height()],
+            'canvas': [self.preview_canvas.winfo_width(), self.preview_canvas.winfo_height()],
+        }
+        try:
+            self.recorder = ActionRecorder(path, header)
+        except OSError as e:
+            print(f"Не удалось начать запись действий: {e}")
+            return
+        self.recorded_window = tuple(header['window'])
+    
+    def record(self, action, **args):
+        """Одно действие в запись (если она включена)"""
+        if self.recorder:
+            self.recorder.record(action, **args)
+    
+    def open_files(self, files):
+        """Открытие файлов, переданных при запуске"""
+        if not self.controls_ready:
+            self.pending_files.extend(files)
+            return
+        
+        # Поднимаем окно, чтобы было видно результат
+        self.root.deiconify()
+        self.root.lift()
+        
+        if not files:
+            return
+        
+        path = files[-1]
+        if os.path.isdir(path):
+            self.start_slideshow(path, hotkeys=True)
+        else:
+            self.load_image_file(path)
+            self.start_slideshow(os.path.dirname(path), path)
+    
+    def ensure_controls(self):
+        """Построение панели настроек, если она еще не создана"""
+        if self.controls_ready:
+            return
+        self.controls_ready = True
+        
+        settings_container = self.scrollable_frame.scrollable_frame
+        self.create_control_buttons(settings_container)
+        self.create_size_controls(settings_container)
+        self.create_position_controls(settings_container)
+        self.create_hotkey_controls(settings_container)
+        self.create_additional_controls(settings_container)
+        self.create_compare_controls(settings_container)
+        self.create_adjustment_controls(settings_container)
+        
+        # Загрузка настроек и прошлой сессии
+        self.load_settings()
+        self.restore_session()
+    
+    def warm_imports(self):
+        """Фоновая загрузка Pillow, чтобы первое открытие файла было быстрым"""
+        try:
+            ImageTk.load()
+        except Exception as e:
+            print(f"Ошибка загрузки Pillow: {e}")
+        
+    def px(self, pixels):
+        """Размер в пикселях при масштабе экрана 100% -> размер на этом экране"""
+        return round(pixels * self.ui_scale)
+    
     def center_window(self):
         """Центрирование окна на экране"""
-        self.root.update_idletasks()
-        width = 1200
-        height = 700
+        width = min(self.px(1200), self.root.winfo_screenwidth())
+        height = min(self.px(700), self.root.winfo_screenheight())
         x = (self.root.winfo_screenwidth() // 2) - (width // 2)
         y = (self.root.winfo_screenheight() // 2) - (height // 2)
         self.root.geometry(f'{width}x{height}+{x}+{y}')
@@ -152,13 +2489,58 @@ class ImageOverlayApp:
         self.bind_key = "ctrl+shift+space"
         self.position = "top-right"
         self.original_size = None
-        self.drag_data = {"x": 0, "y": 0, "item": None}
+        self.drag_data = {}
+        self.drag_stats = None
         self.scale_factor = 1.0
+        self.preview_offset = [0, 0]
+        self.preview_cache = None
+        self.preview_placeholder = None
+        self.image_path = None
+        self.image_name = None
+        self.load_generation = 0
+        self.loading_path = None
+        self.loading_size = None
+        self.recent_files = []
+        self.recent_thumbnails = []
+        self.overlay_label = None
+        self.overlay_xy = None
+        self.settings = SettingsStore(os.path.join(user_dir('config'), 'settings.json'))
+        self.settings_loaded = False
+        self.disk_cache = DiskBitmapCache(user_dir('cache'))
+        self.selection = None
+        self.level_request = None
+        self.preview_origin = (0, 0)
+        self.region_overlays = []
+        self.region_cache = BoundedCache(REGION_CACHE_ITEMS)
+        self.store = ImageStore()
+        self.comparer = ImageComparer()
+        self.adjustments = AdjustmentPipeline()
+        self.refresh_job = None
+        self.overlay_base = None
+        self.overlay_source = None
+        self.preview_key = None
+        self.thumbnail_due = None
+        self.scheduler = RenderScheduler(self.call_in_ui)
+        self.animator = Animator(self.root)
+        self.recorder = None
+        self.slideshow_hotkeys = False
+        self.recorded_window = None
+        self.slideshow = FolderSlideshow(on_update=self.on_slideshow_update, decoder=self.store.decode,
+                                         store=self.store)
         
         # Переменные для ползунков
         self.width_var = tk.IntVar(value=800)
         self.height_var = tk.IntVar(value=600)
         
+        # Переменные настроек (нужны до построения панелей)
+        self.position_var = tk.StringVar(value="top-right")
+        self.monitor_var = tk.IntVar(value=0)
+        self.displays = DisplayGeometry(self.root)
+        self.overlay_scale = 1.0
+        self.always_on_top_var = tk.BooleanVar(value=True)
+        self.show_border_var = tk.BooleanVar(value=True)
+        self.compare_mode_var = tk.StringVar(value='off')
+        
         # Цветовая схема
         self.colors = {
             'primary': '#3498db',
@@ -176,6 +2558,8 @@ class ImageOverlayApp:
     
     def setup_ui(self):
         """Настройка пользовательского интерфейса"""
+        self.wheel_router = WheelRouter(self.root)
+        
         # Устанавливаем цвет фона
         self.root.configure(bg=self.colors['dark_bg'])
         
@@ -200,10 +2584,31 @@ class ImageOverlayApp:
         file_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Файл", menu=file_menu)
         file_menu.add_command(label="Открыть", command=self.load_image)
+        file_menu.add_command(label="Открыть папку", command=self.open_folder)
+        self.recent_menu = tk.Menu(file_menu, tearoff=0, postcommand=self.build_recent_menu)
+        file_menu.add_cascade(label="Недавние", menu=self.recent_menu)
         file_menu.add_command(label="Сохранить", command=self.save_image)
         file_menu.add_separator()
         file_menu.add_command(label="Выход", command=self.on_closing)
         
+        # Меню Области
+        region_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Области", menu=region_menu)
+        region_menu.add_command(label="Выделите область на превью мышью", state=tk.DISABLED)
+        region_menu.add_command(label="Открепить все области", command=self.close_region_overlays)
+        
+        # Меню Сравнение
+        compare_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Сравнение", menu=compare_menu)
+        compare_menu.add_command(label="Открыть второе изображение", command=self.load_compare_image)
+        compare_menu.add_separator()
+        for mode, label in COMPARE_MODES.items():
+            compare_menu.add_radiobutton(label=label, value=mode,
+                                         variable=self.compare_mode_var,
+                                         command=self.on_compare_mode_change)
+        compare_menu.add_separator()
+        compare_menu.add_command(label="Закрыть второе изображение", command=self.close_compare_image)
+        
         # Меню Помощь
         help_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Помощь", menu=help_menu)
@@ -211,7 +2616,7 @@ class ImageOverlayApp:
     
     def create_header(self):
         """Создание заголовка"""
-        header_frame = tk.Frame(self.root, bg=self.colors['darker_bg'], height=70)
+        header_frame = tk.Frame(self.root, bg=self.colors['darker_bg'], height=self.px(70))
         header_frame.pack(fill=tk.X)
         header_frame.pack_propagate(False)
         
@@ -246,12 +2651,12 @@ class ImageOverlayApp:
         main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
         # Левая панель с прокруткой
-        left_container = tk.Frame(main_frame, bg=self.colors['dark_bg'], width=400)
+        left_container = tk.Frame(main_frame, bg=self.colors['dark_bg'], width=self.px(400))
         left_container.pack(side=tk.LEFT, fill=tk.BOTH, padx=(0, 10))
         left_container.pack_propagate(False)
         
         # Заголовок левой панели
-        left_header = tk.Frame(left_container, bg=self.colors['primary'], height=40)
+        left_header = tk.Frame(left_container, bg=self.colors['primary'], height=self.px(40))
         left_header.pack(fill=tk.X)
         left_header.pack_propagate(False)
         
@@ -261,19 +2666,10 @@ class ImageOverlayApp:
                 bg=self.colors['primary']).pack(pady=10)
         
         # Создаем прокручиваемый фрейм для настроек
-        self.scrollable_frame = ScrollableFrame(left_container)
+        # (сами настройки добавляются в ensure_controls после показа окна)
+        self.scrollable_frame = ScrollableFrame(left_container, wheel_router=self.wheel_router)
         self.scrollable_frame.pack(fill=tk.BOTH, expand=True)
         
-        # Контейнер для всех настроек
-        settings_container = self.scrollable_frame.scrollable_frame
-        
-        # Добавляем все настройки
-        self.create_control_buttons(settings_container)
-        self.create_size_controls(settings_container)
-        self.create_position_controls(settings_container)
-        self.create_hotkey_controls(settings_container)
-        self.create_additional_controls(settings_container)
-        
         # Правая панель (предпросмотр)
         self.create_preview_panel(main_frame)
     
@@ -392,6 +2788,22 @@ class ImageOverlayApp:
                  padx=20, pady=8,
                  cursor='hand2').pack(side=tk.LEFT)
     
+    def get_size_fields(self, default=None):
+        """Размер из полей ввода"""
+        try:
+            return int(self.width_entry.get()), int(self.height_entry.get())
+        except ValueError:
+            return default
+    
+    def set_size_fields(self, width, height):
+        """Установка размера в ползунки и поля ввода"""
+        self.width_scale.set(width)
+        self.height_scale.set(height)
+        self.width_entry.delete(0, tk.END)
+        self.width_entry.insert(0, str(width))
+        self.height_entry.delete(0, tk.END)
+        self.height_entry.insert(0, str(height))
+    
     def on_width_scale_change(self, value):
         """Обработчик изменения ползунка ширины"""
         try:
@@ -445,15 +2857,7 @@ class ImageOverlayApp:
         positions_grid = tk.Frame(pos_frame, bg=self.colors['card_bg'])
         positions_grid.pack()
         
-        positions = [
-            ("↖", "top-left"), ("⬆", "top-center"), ("↗", "top-right"),
-            ("⬅", "middle-left"), ("⏺", "center"), ("➡", "middle-right"),
-            ("↙", "bottom-left"), ("⬇", "bottom-center"), ("↘", "bottom-right")
-        ]
-        
-        self.position_var = tk.StringVar(value="top-right")
-        
-        for i, (symbol, value) in enumerate(positions):
+        for i, (value, symbol) in enumerate(OVERLAY_POSITIONS.items()):
             row, col = divmod(i, 3)
             btn = tk.Radiobutton(positions_grid, text=symbol,
                                variable=self.position_var,
@@ -466,6 +2870,42 @@ class ImageOverlayApp:
                                width=3, height=1,
                                command=self.update_position)
             btn.grid(row=row, column=col, padx=5, pady=5, ipadx=5, ipady=5)
+        
+        # Выбор монитора
+        monitor_frame = tk.Frame(pos_frame, bg=self.colors['card_bg'])
+        monitor_frame.pack(fill=tk.X, pady=(10, 0))
+        
+        tk.Label(monitor_frame, text="Монитор:",
+                font=('Segoe UI', 10),
+                fg=self.colors['text_secondary'],
+                bg=self.colors['card_bg']).pack(side=tk.LEFT)
+        
+        self.monitor_combo = ttk.Combobox(monitor_frame, state='readonly',
+                                         postcommand=self.update_monitor_list)
+        self.monitor_combo.pack(side=tk.RIGHT, fill=tk.X, expand=True, padx=(10, 0))
+        self.monitor_combo.bind('<<ComboboxSelected>>', self.on_monitor_selected)
+    
+    def update_monitor_list(self):
+        """Список мониторов в выпадающем списке (перечитывается при открытии)"""
+        monitors = self.displays.get()
+        self.monitor_combo['values'] = [self.displays.describe(m, i) for i, m in enumerate(monitors)]
+        index = self.monitor_var.get()
+        self.monitor_combo.current(index if index < len(monitors) else 0)
+    
+    def on_monitor_selected(self, event):
+        self.monitor_var.set(self.monitor_combo.current())
+        self.update_position()
+    
+    def overlay_monitor(self):
+        """Монитор окна поверх экрана: выбранный или тот, куда его перетащили"""
+        if self.overlay_xy:
+            return monitor_at(self.displays.get(), *self.overlay_xy)
+        return self.displays.monitor(self.monitor_var.get())
+    
+    def device_size(self, width, height, monitor=None):
+        """Размер окна поверх экрана в физических пикселях монитора"""
+        scale = (monitor or self.overlay_monitor())['scale']
+        return max(1, round(width * scale)), max(1, round(height * scale))
     
     def create_hotkey_controls(self, parent):
         """Создание элементов управления горячими клавишами"""
@@ -550,15 +2990,20 @@ class ImageOverlayApp:
                                     bg=self.colors['card_bg'],
                                     fg=self.colors['text'],
                                     highlightthickness=0,
-                                    troughcolor=self.colors['primary'])
+                                    troughcolor=self.colors['primary'],
+                                    command=self.on_opacity_change)
         self.opacity_scale.set(100)
         self.opacity_scale.pack(side=tk.RIGHT, fill=tk.X, expand=True)
         
+        # В запись действий - только изменения мышью и клавишами, не set() из программы
+        self.opacity_scale.bind('<ButtonRelease-1>', self.record_opacity)
+        self.opacity_scale.bind('<KeyRelease>', self.record_opacity)
+        
         # Всегда поверх
-        self.always_on_top_var = tk.BooleanVar(value=True)
         on_top_check = tk.Checkbutton(add_frame, 
                                      text="Всегда поверх других окон",
                                      variable=self.always_on_top_var,
+                                     command=self.on_overlay_option_change,
                                      font=('Segoe UI', 10),
                                      fg=self.colors['text_secondary'],
                                      bg=self.colors['card_bg'],
@@ -568,10 +3013,10 @@ class ImageOverlayApp:
         on_top_check.pack(anchor=tk.W, pady=(5, 0))
         
         # Показывать рамку
-        self.show_border_var = tk.BooleanVar(value=True)
         border_check = tk.Checkbutton(add_frame, 
                                      text="Показывать рамку вокруг изображения",
                                      variable=self.show_border_var,
+                                     command=self.on_overlay_option_change,
                                      font=('Segoe UI', 10),
                                      fg=self.colors['text_secondary'],
                                      bg=self.colors['card_bg'],
@@ -580,13 +3025,274 @@ class ImageOverlayApp:
                                      activeforeground=self.colors['text'])
         border_check.pack(anchor=tk.W, pady=(5, 0))
     
+    def on_opacity_change(self, value):
+        """Прозрачность меняется сразу, без перерисовки окна"""
+        if self.overlay_window and not self.batch_depth:
+            self.set_overlay_alpha(int(float(value)) / 100.0)
+        self.save_settings()
+    
+    def record_opacity(self, event):
+        self.record('opacity', value=self.opacity_scale.get())
+    
+    def on_overlay_option_change(self):
+        """Изменение флажков "поверх окон" и "рамка" """
+        if self.overlay_window:
+            self.overlay_window.attributes('-topmost', self.always_on_top_var.get())
+        self.display_preview()
+        self.save_settings()
+    
+    def create_compare_controls(self, parent):
+        """Создание панели сравнения со вторым изображением"""
+        compare_frame = tk.LabelFrame(parent, text="Сравнение",
+                                    font=('Segoe UI', 11, 'bold'),
+                                    fg=self.colors['text'],
+                                    bg=self.colors['card_bg'],
+                                    padx=15, pady=15)
+        compare_frame.pack(fill=tk.X, pady=(0, 5), padx=5)
+        
+        self.compare_info = tk.Label(compare_frame, text="Второе изображение не выбрано",
+                                   font=('Segoe UI', 10),
+                                   fg=self.colors['text_secondary'],
+                                   bg=self.colors['card_bg'])
+        self.compare_info.pack(anchor=tk.W)
+        
+        # Режимы
+        modes_frame = tk.Frame(compare_frame, bg=self.colors['card_bg'])
+        modes_frame.pack(fill=tk.X, pady=(10, 0))
+        
+        for mode, label in COMPARE_MODES.items():
+            tk.Radiobutton(modes_frame, text=label, value=mode,
+                          variable=self.compare_mode_var,
+                          command=self.on_compare_mode_change,
+                          font=('Segoe UI', 9),
+                          fg=self.colors['text_secondary'],
+                          bg=self.colors['card_bg'],
+                          selectcolor=self.colors['primary'],
+                          activebackground=self.colors['card_bg'],
+                          activeforeground=self.colors['text']).pack(side=tk.LEFT)
+        
+        # Смешивание (для шторки - положение границы)
+        factor_frame = tk.Frame(compare_frame, bg=self.colors['card_bg'])
+        factor_frame.pack(fill=tk.X, pady=(10, 0))
+        
+        tk.Label(factor_frame, text="Смешивание:",
+                font=('Segoe UI', 10),
+                fg=self.colors['text_secondary'],
+                bg=self.colors['card_bg']).pack(side=tk.LEFT)
+        
+        self.compare_scale = tk.Scale(factor_frame, from_=0, to=100,
+                                    orient=tk.HORIZONTAL,
+                                    length=200,
+                                    bg=self.colors['card_bg'],
+                                    fg=self.colors['text'],
+                                    highlightthickness=0,
+                                    troughcolor=self.colors['primary'],
+                                    command=self.on_compare_factor_change)
+        self.compare_scale.set(int(self.comparer.factor * 100))
+        self.compare_scale.pack(side=tk.RIGHT, fill=tk.X, expand=True)
+        
+        tk.Button(compare_frame, text="📂 Второе изображение",
+                 command=self.load_compare_image,
+                 font=('Segoe UI', 10),
+                 bg=self.colors['primary'],
+                 fg='white',
+                 activebackground=self.colors['primary_dark'],
+                 relief=tk.FLAT,
+                 cursor='hand2').pack(fill=tk.X, pady=(10, 0))
+    
+    def load_compare_image(self):
+        """Выбор второго изображения для сравнения"""
+        file_path = filedialog.askopenfilename(
+            title="Выберите изображение для сравнения",
+            filetypes=[
+                ("Изображения", " ".join("*" + ext for ext in IMAGE_EXTENSIONS)),
+                ("Все файлы", "*.*")
+            ]
+        )
+        if not file_path:
+            return
+        
+        self.update_status(f"Загрузка для сравнения: {os.path.basename(file_path)}...")
+        self.scheduler.submit('compare', lambda check: self.store.decode(file_path), (),
+                              on_done=lambda decoded: self.apply_compare_image(file_path, decoded, None),
+                              on_error=lambda e: self.apply_compare_image(file_path, None, e))
+    
+    def apply_compare_image(self, file_path, decoded, error):
+        if error is not None:
+            messagebox.showerror("Ошибка", f"Не удалось загрузить изображение:\n{error}")
+            return
+        
+        self.comparer.set_reference(file_path, decoded['image'])
+        self.store.track('compare', decoded['image'])
+        self.compare_mode_var.set(self.comparer.mode)
+        if self.controls_ready:
+            self.compare_info.config(text=f"С чем сравниваем: {os.path.basename(file_path)}")
+        self.refresh_bitmaps()
+        self.update_status(f"Сравнение с {os.path.basename(file_path)} | {self.store.memory_text()}")
+    
+    def close_compare_image(self):
+        self.comparer.clear()
+        self.store.track('compare', None)
+        self.compare_mode_var.set('off')
+        if self.controls_ready:
+            self.compare_info.config(text="Второе изображение не выбрано")
+        self.refresh_bitmaps()
+    
+    def on_compare_mode_change(self):
+        self.comparer.mode = self.compare_mode_var.get()
+        if self.comparer.mode != 'off' and self.comparer.reference is None:
+            self.load_compare_image()
+            return
+        self.refresh_bitmaps()
+    
+    def on_compare_factor_change(self, value):
+        """Ползунок пересчитывает только смесь - не чаще раза за кадр"""
+        self.comparer.factor = int(float(value)) / 100.0
+        if self.comparer.active:
+            self.schedule_refresh()
+    
+    def create_adjustment_controls(self, parent):
+        """Создание панели коррекции изображения"""
+        adjust_frame = tk.LabelFrame(parent, text="Коррекция",
+                                   font=('Segoe UI', 11, 'bold'),
+                                   fg=self.colors['text'],
+                                   bg=self.colors['card_bg'],
+                                   padx=15, pady=15)
+        adjust_frame.pack(fill=tk.X, pady=(0, 5), padx=5)
+        
+        # Ползунки
+        self.adjustment_scales = {}
+        for name, label, low, high in (('brightness', "Яркость:", 10, 200),
+                                       ('contrast', "Контраст:", 10, 200),
+                                       ('tint', "Оттенок:", 0, 100)):
+            row = tk.Frame(adjust_frame, bg=self.colors['card_bg'])
+            row.pack(fill=tk.X, pady=(0, 5))
+            
+            tk.Label(row, text=label,
+                    font=('Segoe UI', 10),
+                    fg=self.colors['text_secondary'],
+                    bg=self.colors['card_bg']).pack(side=tk.LEFT)
+            
+            scale = tk.Scale(row, from_=low, to=high,
+                           orient=tk.HORIZONTAL,
+                           length=200,
+                           bg=self.colors['card_bg'],
+                           fg=self.colors['text'],
+                           highlightthickness=0,
+                           troughcolor=self.colors['primary'],
+                           command=lambda value, name=name: self.on_adjustment_change(name, int(float(value))))
+            scale.set(ADJUSTMENT_DEFAULTS[name])
+            scale.pack(side=tk.RIGHT, fill=tk.X, expand=True)
+            self.adjustment_scales[name] = scale
+        
+        # Флажки
+        self.adjustment_vars = {}
+        for name, label in (('grayscale', "Оттенки серого"), ('invert', "Инверсия")):
+            var = tk.BooleanVar(value=ADJUSTMENT_DEFAULTS[name])
+            tk.Checkbutton(adjust_frame, text=label,
+                          variable=var,
+                          command=lambda name=name, var=var: self.on_adjustment_change(name, var.get()),
+                          font=('Segoe UI', 10),
+                          fg=self.colors['text_secondary'],
+                          bg=self.colors['card_bg'],
+                          selectcolor=self.colors['primary'],
+                          activebackground=self.colors['card_bg'],
+                          activeforeground=self.colors['text']).pack(anchor=tk.W, pady=(5, 0))
+            self.adjustment_vars[name] = var
+        
+        buttons = tk.Frame(adjust_frame, bg=self.colors['card_bg'])
+        buttons.pack(fill=tk.X, pady=(10, 0))
+        
+        self.tint_button = tk.Button(buttons, text="🎨 Цвет оттенка",
+                                    command=self.choose_tint_color,
+                                    font=('Segoe UI', 10),
+                                    bg=self.adjustments.params['tint_color'],
+                                    fg='white',
+                                    relief=tk.FLAT,
+                                    cursor='hand2')
+        self.tint_button.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        
+        tk.Button(buttons, text="↺ Сбросить",
+                 command=self.reset_adjustments,
+                 font=('Segoe UI', 10),
+                 bg=self.colors['warning'],
+                 fg='white',
+                 relief=tk.FLAT,
+                 cursor='hand2').pack(side=tk.LEFT, fill=tk.X, expand=True)
+    
+    def on_adjustment_change(self, name, value):
+        if self.adjustments.params[name] == value:
+            return
+        self.record('adjust', name=name, value=value)
+        self.adjustments.update({name: value})
+        self.schedule_refresh()
+        self.save_settings()
+    
+    def choose_tint_color(self):
+        color = colorchooser.askcolor(color=self.adjustments.params['tint_color'],
+                                      title="Цвет оттенка")[1]
+        if color:
+            self.tint_button.config(bg=color)
+            self.on_adjustment_change('tint_color', color)
+    
+    def set_adjustments(self, values):
+        """Установка параметров коррекции вместе с элементами управления"""
+        self.adjustments.reset()
+        self.adjustments.update(values)
+        params = self.adjustments.params
+        for name, scale in self.adjustment_scales.items():
+            scale.set(params[name])
+        for name, var in self.adjustment_vars.items():
+            var.set(params[name])
+        self.tint_button.config(bg=params['tint_color'])
+    
+    def reset_adjustments(self):
+        self.set_adjustments({})
+        self.schedule_refresh()
+        self.save_settings()
+    
+    def effects_snapshot(self):
+        """Параметры коррекции и сравнения для фоновой перерисовки"""
+        return (self.adjustments.stages(), self.comparer.snapshot())
+    
+    def render_bitmap(self, check, image, width, height, scaled, effects):
+        """Масштабирование, коррекция и сравнение (в фоновом потоке).
+        
+        scaled - уже масштабированный битмап, если есть. Возвращает
+        (масштабированный битмап, итоговый битмап).
+        """
+        if scaled is None:
+            scaled = scale_bitmap(image, width, height)
+        
+        stages, compare = effects
+        bitmap = scaled
+        if stages:
+            check()
+            bitmap = self.adjustments.apply(bitmap, stages)
+        if compare:
+            check()
+            bitmap = self.comparer.compose(bitmap, *compare[1:])
+        return scaled, bitmap
+    
+    def schedule_refresh(self):
+        """Перерисовка после ползунков - не чаще раза за кадр"""
+        if not self.refresh_job:
+            self.refresh_job = self.root.after(DRAG_FRAME_MS, self.refresh_bitmaps)
+    
+    def refresh_bitmaps(self):
+        """Перерисовка превью и окна поверх экрана из готовых буферов"""
+        self.refresh_job = None
+        self.display_preview()
+        if self.is_pinned and self.image:
+            self.create_overlay()
+    
     def create_preview_panel(self, parent):
         """Создание правой панели с предпросмотром"""
         right_panel = tk.Frame(parent, bg=self.colors['darker_bg'])
         right_panel.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
         
         # Заголовок предпросмотра с информацией
-        preview_header = tk.Frame(right_panel, bg=self.colors['darker_bg'], height=40)
+        preview_header = tk.Frame(right_panel, bg=self.colors['darker_bg'], height=self.px(40))
         preview_header.pack(fill=tk.X)
         preview_header.pack_propagate(False)
         
@@ -620,46 +3326,224 @@ class ImageOverlayApp:
                                        justify=tk.CENTER,
                                        tags="placeholder")
         
-        # Информация о размере на Canvas
-        self.preview_canvas.create_text(400, 300,
-                                       text="",
-                                       fill='#95a5a6',
-                                       font=('Segoe UI', 10),
-                                       justify=tk.CENTER,
-                                       tags="size_info")
+        # Информация о размере на Canvas
+        self.preview_canvas.create_text(400, 300,
+                                       text="",
+                                       fill='#95a5a6',
+                                       font=('Segoe UI', 10),
+                                       justify=tk.CENTER,
+                                       tags="size_info")
+        
+        # Настройка drag&drop
+        self.setup_drag_drop()
+        
+        # Масштабирование колесиком мыши
+        self.wheel_router.register(self.preview_canvas, self.on_preview_zoom)
+        
+        # Перерисовка при изменении размера (повторные запросы отсекает display_preview)
+        self.preview_canvas.bind('<Configure>', self.on_preview_configure)
+    
+    def setup_drag_drop(self):
+        """Настройка drag&drop для Canvas"""
+        # В Windows для drag&drop нужно использовать протокол DND
+        def on_drop(event):
+            # Простая реализация drag&drop
+            file_path = event.data
+            if file_path:
+                self.load_image_file(file_path)
+        
+        # Упрощенная версия drag&drop: щелчок - открыть файл,
+        # протягивание по изображению - выделить область и закрепить ее
+        self.preview_canvas.bind('<Button-1>', self.on_preview_press)
+        self.preview_canvas.bind('<B1-Motion>', self.on_preview_drag)
+        self.preview_canvas.bind('<ButtonRelease-1>', self.on_preview_release)
+    
+    def on_preview_press(self, event):
+        self.selection = {'start': (event.x, event.y), 'rect': None}
+    
+    def on_preview_drag(self, event):
+        """Рамка выделения области"""
+        selection = self.selection
+        if not selection or not self.image:
+            return
+        
+        x0, y0 = selection['start']
+        if selection['rect'] is None:
+            if abs(event.x - x0) < 4 and abs(event.y - y0) < 4:
+                return
+            selection['rect'] = self.preview_canvas.create_rectangle(
+                x0, y0, event.x, event.y,
+                outline=self.colors['warning'], dash=(4, 2), width=2)
+        else:
+            self.preview_canvas.coords(selection['rect'], x0, y0, event.x, event.y)
+    
+    def on_preview_release(self, event):
+        selection, self.selection = self.selection, None
+        if not selection:
+            return
+        
+        # Перерисовка, пропущенная во время выделения
+        self.display_preview()
+        
+        if selection['rect'] is None:
+            # Обычный щелчок
+            self.load_image()
+            return
+        
+        self.preview_canvas.delete(selection['rect'])
+        box = self.canvas_to_source_box(selection['start'], (event.x, event.y))
+        if box:
+            left = min(selection['start'][0], event.x) + self.preview_canvas.winfo_rootx()
+            top = min(selection['start'][1], event.y) + self.preview_canvas.winfo_rooty()
+            self.pin_region(box, (left, top))
+    
+    def canvas_to_source_box(self, start, end):
+        """Прямоугольник на превью -> область исходного изображения"""
+        if not self.image:
+            return None
+        
+        source_width, source_height = self.store.source_size or self.image.size
+        scale_x = source_width / (self.image.width * self.scale_factor)
+        scale_y = source_height / (self.image.height * self.scale_factor)
+        ox, oy = self.preview_origin
+        
+        x0, x1 = sorted((start[0], end[0]))
+        y0, y1 = sorted((start[1], end[1]))
+        box = (max(0, int((x0 - ox) * scale_x)), max(0, int((y0 - oy) * scale_y)),
+               min(source_width, int(math.ceil((x1 - ox) * scale_x))),
+               min(source_height, int(math.ceil((y1 - oy) * scale_y))))
+        if box[2] - box[0] < 2 or box[3] - box[1] < 2:
+            return None
+        return box
+    
+    def region_bitmap(self, box):
+        """Пиксели области исходника, без декодирования лишнего.
+        
+        Если рабочая копия полноразмерная, все области вырезаются из этого
+        общего буфера. Для уменьшенной копии область читается из исходника
+        (по тайлам/строкам, где формат позволяет, иначе - из декодированного
+        целиком исходника в пределах бюджета памяти; он остается для
+        следующих областей).
+        """
+        key = (self.image_path, box)
+        region = self.region_cache.get(key)
+        if region is not None:
+            return region
         
-        # Настройка drag&drop
-        self.setup_drag_drop()
+        if self.store.downsampled and self.image_path:
+            try:
+                region = self.store.read_region(box)
+            except Exception as e:
+                print(f"Ошибка чтения области: {e}")
         
-        # Масштабирование колесиком мыши
-        self.preview_canvas.bind("<MouseWheel>", self.on_preview_zoom)
+        if region is None:
+            source_width, source_height = self.store.source_size or self.image.size
+            sx = self.image.width / source_width
+            sy = self.image.height / source_height
+            region = self.image.crop((int(box[0] * sx), int(box[1] * sy),
+                                      max(int(box[0] * sx) + 1, int(box[2] * sx)),
+                                      max(int(box[1] * sy) + 1, int(box[3] * sy))))
+        
+        self.region_cache.put(key, region)
+        return region
     
-    def setup_drag_drop(self):
-        """Настройка drag&drop для Canvas"""
-        # В Windows для drag&drop нужно использовать протокол DND
-        def on_drop(event):
-            # Простая реализация drag&drop
-            file_path = event.data
-            if file_path:
-                self.load_image_file(file_path)
+    def pin_region(self, box, screen_xy):
+        """Закрепление области изображения поверх окон"""
+        region = self.region_bitmap(box)
+        
+        # Область не больше заданного размера окна, сначала обрезка, потом масштаб.
+        # Битмап - в физических пикселях монитора, как у окна поверх экрана
+        max_width, max_height = self.get_size_fields(region.size)
+        fit = min(1.0, max_width / region.width, max_height / region.height)
+        monitor = monitor_at(self.displays.get(), *screen_xy)
+        bitmap = scale_bitmap(region, *self.device_size(max(1, int(region.width * fit)),
+                                                        max(1, int(region.height * fit)), monitor))
+        photo = ImageTk.PhotoImage(bitmap)
+        
+        window = tk.Toplevel(self.root)
+        window.overrideredirect(True)
+        window.attributes('-topmost', self.always_on_top_var.get())
+        window.attributes('-alpha', self.opacity_scale.get() / 100.0)
+        window.configure(bg='black')
+        
+        label = tk.Label(window, image=photo, bg='black', bd=0)
+        label.image = photo
+        label.pack()
+        window.geometry(f"{bitmap.width}x{bitmap.height}+{screen_xy[0]}+{screen_xy[1]}")
+        
+        label.bind('<Button-1>', self.start_move)
+        label.bind('<B1-Motion>', self.on_move)
+        label.bind('<ButtonRelease-1>', self.stop_move)
+        label.bind('<Button-3>', lambda e: self.close_region_overlay(window))
         
-        # Упрощенная версия drag&drop
-        self.preview_canvas.bind('<Button-1>', lambda e: self.load_image())
+        self.region_overlays.append(window)
+        self.update_status(f"Закреплена область {box[2] - box[0]}×{box[3] - box[1]} "
+                           f"(ПКМ по ней - открепить)")
+    
+    def close_region_overlay(self, window):
+        if window in self.region_overlays:
+            self.region_overlays.remove(window)
+        window.destroy()
+    
+    def close_region_overlays(self):
+        """Открепление всех областей"""
+        for window in list(self.region_overlays):
+            self.close_region_overlay(window)
     
-    def on_preview_zoom(self, event):
-        """Масштабирование превью колесиком мыши"""
+    def on_preview_configure(self, event):
+        """Изменился размер превью - перерисовываем (и записываем размер окна)"""
+        if self.recorder:
+            window = (self.root.winfo_width(), self.root.winfo_height())
+            if window != self.recorded_window:
+                self.recorded_window = window
+                self.record('window', width=window[0], height=window[1])
+        self.display_preview()
+    
+    def on_preview_zoom(self, steps, x_root=None, y_root=None):
+        """Масштабирование превью колесиком мыши (steps - щелчков за кадр)
+        
+        Точка изображения под курсором остается на месте.
+        """
         if not self.image:
             return
         
+        # Точку записываем относительно превью - при повторе окно будет в другом месте
+        if self.recorder:
+            if x_root is None:
+                self.record('zoom', steps=steps)
+            else:
+                self.record('zoom', steps=steps,
+                            x=x_root - self.preview_canvas.winfo_rootx(),
+                            y=y_root - self.preview_canvas.winfo_rooty())
+        
         # Определяем направление прокрутки
-        if event.delta > 0:
-            self.scale_factor *= 1.1
+        old_scale = self.scale_factor
+        if steps > 0:
+            self.scale_factor *= 1.1 ** steps
         else:
-            self.scale_factor *= 0.9
+            self.scale_factor *= 0.9 ** -steps
         
         # Ограничиваем масштаб
         self.scale_factor = max(0.1, min(5.0, self.scale_factor))
         
+        # При увеличении многоуровневого файла догружаем подробный уровень
+        if self.scale_factor > 1.0:
+            self.request_level((int(self.image.width * self.scale_factor),
+                                int(self.image.height * self.scale_factor)))
+        
+        # Сдвигаем изображение так, чтобы точка под курсором не уехала
+        if x_root is not None:
+            canvas_width = self.preview_canvas.winfo_width()
+            canvas_height = self.preview_canvas.winfo_height()
+            cursor = (x_root - self.preview_canvas.winfo_rootx(),
+                      y_root - self.preview_canvas.winfo_rooty())
+            ratio = self.scale_factor / old_scale
+            for axis, canvas_size, image_size in ((0, canvas_width, self.image.width),
+                                                  (1, canvas_height, self.image.height)):
+                old_origin = (canvas_size - int(image_size * old_scale)) // 2 + self.preview_offset[axis]
+                new_origin = cursor[axis] - (cursor[axis] - old_origin) * ratio
+                self.preview_offset[axis] = int(new_origin - (canvas_size - int(image_size * self.scale_factor)) // 2)
+        
         # Обновляем превью
         self.display_preview()
     
@@ -685,49 +3569,368 @@ class ImageOverlayApp:
         file_path = filedialog.askopenfilename(
             title="Выберите изображение",
             filetypes=[
-                ("Изображения", "*.png *.jpg *.jpeg *.bmp *.gif *.tiff *.webp"),
+                ("Изображения", " ".join("*" + ext for ext in IMAGE_EXTENSIONS)),
                 ("Все файлы", "*.*")
             ]
         )
         
         if file_path:
             self.load_image_file(file_path)
+            self.start_slideshow(os.path.dirname(file_path), file_path)
+    
+    def load_image_file(self, file_path, show_errors=True, decoded=None, background=True, size=None):
+        """Загрузка изображения из файла
+        
+        decoded - заранее декодированное изображение и превью (режим папки).
+        Иначе файл декодируется в фоне; если его уже открывали, превью из
+        дискового кэша показывается сразу (background=False - декодировать
+        здесь же, для скриптов).
+        size - размер окна поверх экрана (по умолчанию - размер изображения).
+        """
+        self.ensure_controls()
+        self.record('load', path=os.path.abspath(file_path), size=size)
+        self.update_target_size()
+        self.load_generation += 1
+        self.loading_path = None
+        self.level_request = None
+        self.scheduler.cancel('load')
+        self.scheduler.cancel('level')
+        
+        if decoded is not None or not background:
+            try:
+                # Открываем изображение
+                self.apply_loaded_image(file_path, decoded or self.store.decode(file_path), size=size)
+            except Exception as e:
+                if not show_errors:
+                    raise
+                messagebox.showerror("Ошибка", f"Не удалось загрузить изображение:\n{str(e)}")
+            return
+        
+        # Декодирование и перевод в профиль экрана - в фоне, окно не замирает
+        self.loading_path = file_path
+        self.loading_size = size
+        cached_preview = self.disk_cache.get(file_path, 'preview')
+        if cached_preview is not None:
+            self.show_cached_preview(file_path, cached_preview)
+        else:
+            self.update_status(f"Загрузка: {os.path.basename(file_path)}...")
+        
+        generation = self.load_generation
+        self.scheduler.submit('load', self.decode_for_load, (file_path, cached_preview),
+                              on_done=lambda decoded: self.finish_background_load(
+                                  file_path, generation, decoded, None, size),
+                              on_error=lambda e: self.finish_background_load(
+                                  file_path, generation, None, e, size, show_errors))
+    
+    def decode_for_load(self, check, file_path, preview):
+        """Декодирование файла (в фоновом потоке)"""
+        decoded = self.store.decode(file_path)
+        decoded['preview'] = preview
+        return decoded
     
-    def load_image_file(self, file_path):
-        """Загрузка изображения из файла"""
+    def finish_background_load(self, file_path, generation, decoded, error, size=None, show_errors=True):
+        """Фоновое декодирование закончено (в потоке Tk)"""
+        if generation != self.load_generation:
+            # Пока декодировали, пользователь открыл другой файл
+            return
+        self.loading_path = None
         try:
-            # Открываем изображение
-            self.image = Image.open(file_path)
-            self.original_size = self.image.size
-            
-            # Обновляем UI
-            self.display_preview()
-            
-            # Устанавливаем размеры
-            self.width_scale.set(self.image.width)
-            self.height_scale.set(self.image.height)
-            self.width_entry.delete(0, tk.END)
-            self.width_entry.insert(0, str(self.image.width))
-            self.height_entry.delete(0, tk.END)
-            self.height_entry.insert(0, str(self.image.height))
-            
-            # Обновляем информацию
-            filename = os.path.basename(file_path)
-            info_text = f"{filename} | {self.image.width}×{self.image.height}"
-            self.image_info.config(text=info_text)
-            
-            self.update_status(f"Загружено: {filename}")
-            
+            if error:
+                raise error
+            self.apply_loaded_image(file_path, decoded, preview_cached=decoded['preview'] is not None, size=size)
         except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить изображение:\n{str(e)}")
+            if show_errors:
+                messagebox.showerror("Ошибка", f"Не удалось загрузить изображение:\n{str(e)}")
+            else:
+                print(f"Ошибка загрузки {file_path}: {e}")
     
-    def display_preview(self):
-        """Отображение превью"""
-        if not self.image:
+    def apply_loaded_image(self, file_path, decoded, preview_cached=False, size=None):
+        """Установка загруженного изображения текущим
+        
+        decoded - результат decode_image (и, возможно, готовое превью).
+        preview_cached - превью взято из дискового кэша и записывать его не нужно
+        """
+        image = decoded['image']
+        preview = decoded.get('preview')
+        self.store.set(file_path, decoded)
+        self.region_cache.clear()
+        self.image = image
+        self.image_path = file_path
+        self.image_name = os.path.basename(file_path)
+        self.original_size = self.image.size
+        self.preview_offset = [0, 0]
+        if preview is not None:
+            self.preview_cache = (image, preview.width, preview.height, preview)
+        # Превью из дискового кэша второй раз не записываем
+        self.thumbnail_due = None if preview_cached else file_path
+        
+        # Обновляем UI
+        self.display_preview()
+        
+        # Устанавливаем размеры
+        self.set_size_fields(*(size or self.image.size))
+        
+        # Закрепленное окно показывает новое изображение
+        if self.is_pinned:
+            self.create_overlay()
+        
+        # Обновляем информацию
+        filename = os.path.basename(file_path)
+        self.update_image_info()
+        
+        # Превью и миниатюра для следующего открытия (если превью уже готово)
+        self.save_preview_thumbnails()
+        self.remember_recent(file_path)
+        self.save_settings()
+        
+        if self.store.warning:
+            self.update_status(f"⚠ {self.store.warning}")
+        else:
+            self.update_status(f"Загружено: {filename} | {self.store.memory_text()}")
+    
+    def load_image_bytes(self, data, name="stdin", show_errors=True):
+        """Загрузка изображения из памяти (stdin, канал, буфер) без временного файла.
+        
+        bytes используются без копирования (BytesIO разделяет буфер), другие
+        буферы копируются один раз. Декодирование идет в фоне; если следом
+        пришли новые данные, старые не декодируются (режим потока).
+        """
+        self.ensure_controls()
+        self.update_target_size()
+        self.load_generation += 1
+        self.loading_path = None
+        self.level_request = None
+        self.scheduler.cancel('level')
+        
+        if not isinstance(data, bytes):
+            data = bytes(memoryview(data))
+        source = io.BytesIO(data)
+        
+        def on_error(e):
+            if show_errors:
+                messagebox.showerror("Ошибка", f"Не удалось загрузить изображение:\n{str(e)}")
+            else:
+                print(f"Ошибка загрузки {name}: {e}")
+        
+        self.scheduler.submit('load', lambda check: self.store.decode(source), (),
+                              on_done=lambda decoded: self.apply_buffer_image(name, source, decoded),
+                              on_error=on_error)
+    
+    def apply_buffer_image(self, name, source, decoded):
+        """Установка изображения из памяти текущим"""
+        previous = self.image
+        self.store.set(source, decoded)
+        self.region_cache.clear()
+        self.image = decoded['image']
+        self.image_path = None
+        self.image_name = name
+        self.original_size = self.image.size
+        self.thumbnail_due = None
+        
+        # Кадры потока того же размера не сбрасывают масштаб и размер окна
+        if previous is None or previous.size != self.image.size:
+            self.preview_offset = [0, 0]
+            self.set_size_fields(*self.image.size)
+        
+        self.display_preview()
+        
+        # Закрепленное окно обновляется на месте
+        if self.is_pinned:
+            self.create_overlay()
+        
+        self.update_image_info()
+        if self.store.warning:
+            self.update_status(f"⚠ {self.store.warning}")
+        else:
+            self.update_status(f"Загружено из памяти: {name} | {self.store.memory_text()}")
+    
+    def read_stream(self, stream, name="stream"):
+        """Чтение кадров с префиксом длины (в фоновом потоке) и показ каждого"""
+        try:
+            for frame in read_frames(stream):
+                self.call_in_ui(self.load_image_bytes, frame, name, False)
+        except (OSError, ValueError) as e:
+            print(f"Ошибка чтения потока: {e}")
+    
+    def update_image_info(self):
+        """Строка с именем, размером, уровнем и номером файла в папке"""
+        if not self.image or not self.image_name:
             return
         
-        # Очищаем Canvas
+        info_text = f"{self.image_name} | {self.image.width}×{self.image.height}"
+        if self.store.downsampled:
+            info_text += f" (из {self.store.source_size[0]}×{self.store.source_size[1]})"
+        level = self.store.level_index()
+        if level:
+            info_text += f" | уровень {level[0]}/{level[1]}"
+        if self.store.icc:
+            info_text += " | ICC"
+        if self.slideshow.is_current(self.image_path):
+            index, total = self.slideshow.position()
+            info_text += f" | {index}/{total}"
+        self.image_info.config(text=info_text)
+    
+    def request_level(self, target_size):
+        """Догрузка более подробного уровня многоуровневого файла (в фоне)"""
+        level = self.store.better_level(target_size)
+        if level is None or not self.image_path or self.level_request == (self.image_path, level):
+            return
+        
+        self.level_request = (self.image_path, level)
+        file_path, generation = self.image_path, self.load_generation
+        self.scheduler.submit('level', lambda check: self.store.decode(file_path, level), (),
+                              on_done=lambda decoded: self.apply_level(file_path, generation, decoded),
+                              on_error=lambda e: self.level_failed(e))
+    
+    def level_failed(self, error):
+        print(f"Ошибка загрузки уровня: {error}")
+        self.level_request = None
+    
+    def apply_level(self, file_path, generation, decoded):
+        """Замена рабочей копии более подробным уровнем того же файла"""
+        self.level_request = None
+        if not decoded or generation != self.load_generation or file_path != self.image_path:
+            return
+        
+        # Масштаб пересчитываем, чтобы превью на экране не изменило размер
+        old_width = self.image.width
+        self.store.set(file_path, decoded)
+        self.image = decoded['image']
+        self.scale_factor *= old_width / self.image.width
+        self.preview_cache = None
+        self.region_cache.clear()
+        
+        self.display_preview()
+        if self.is_pinned:
+            self.create_overlay()
+        self.update_image_info()
+    
+    def show_cached_preview(self, file_path, bitmap):
+        """Превью из дискового кэша, пока файл декодируется"""
+        self.scheduler.cancel('preview')
+        self.preview_key = None
         self.preview_canvas.delete("all")
+        canvas_width = self.preview_canvas.winfo_width()
+        canvas_height = self.preview_canvas.winfo_height()
+        
+        self.preview_placeholder = ImageTk.PhotoImage(bitmap)
+        self.preview_canvas.create_image(canvas_width // 2, canvas_height // 2,
+                                        image=self.preview_placeholder)
+        self.preview_canvas.create_text(canvas_width // 2, canvas_height - 20,
+                                       text="Загрузка...",
+                                       fill='#95a5a6',
+                                       font=('Segoe UI', 10))
+        self.image_info.config(text=f"{os.path.basename(file_path)} | загрузка...")
+    
+    # Недавние файлы
+    
+    def remember_recent(self, file_path):
+        """Добавление файла в начало списка недавних"""
+        file_path = os.path.abspath(file_path)
+        if file_path in self.recent_files:
+            self.recent_files.remove(file_path)
+        self.recent_files.insert(0, file_path)
+        del self.recent_files[RECENT_FILES_MAX:]
+    
+    def build_recent_menu(self):
+        """Заполнение меню недавних файлов с миниатюрами из кэша"""
+        self.recent_menu.delete(0, tk.END)
+        self.recent_thumbnails = []
+        
+        for file_path in self.recent_files:
+            if not os.path.exists(file_path):
+                continue
+            thumbnail = self.disk_cache.get(file_path, 'thumb')
+            photo = ImageTk.PhotoImage(thumbnail) if thumbnail is not None else None
+            if photo:
+                self.recent_thumbnails.append(photo)
+            self.recent_menu.add_command(label=os.path.basename(file_path),
+                                         image=photo or '',
+                                         compound=tk.LEFT,
+                                         command=lambda p=file_path: self.load_image_file(p))
+        
+        if not self.recent_files:
+            self.recent_menu.add_command(label="(пусто)", state=tk.DISABLED)
+    
+    # Режим папки
+    
+    def open_folder(self):
+        """Выбор папки для листания"""
+        folder = filedialog.askdirectory(title="Выберите папку с изображениями")
+        if folder:
+            self.start_slideshow(folder, hotkeys=True)
+    
+    def start_slideshow(self, folder, current=None, hotkeys=False):
+        """Начало листания папки (с указанного файла или с первого).
+        
+        hotkeys - папку открыли явно, листать можно и глобальными клавишами.
+        """
+        self.slideshow.open(folder, current, self.scale_factor, active=hotkeys)
+        self.set_slideshow_hotkeys(hotkeys)
+        if current is None:
+            self.update_status(f"Папка: {os.path.basename(folder) or folder}")
+    
+    def on_slideshow_update(self):
+        """Пришла очередная порция списка файлов (вызывается в потоке листинга)"""
+        self.call_in_ui(self.refresh_slideshow)
+    
+    def refresh_slideshow(self):
+        if self.slideshow.current is None:
+            # Папка открыта без файла - показываем первый найденный
+            self.slideshow_step(1)
+            return
+        
+        self.update_image_info()
+    
+    def slideshow_step(self, direction):
+        """Следующий/предыдущий файл папки"""
+        path = self.slideshow.step(direction, self.scale_factor)
+        if not path:
+            return
+        self.load_image_file(path, decoded=self.slideshow.take(path))
+    
+    def set_slideshow_hotkeys(self, enabled):
+        """Глобальные клавиши листания - только пока папка открыта явно"""
+        if enabled == self.slideshow_hotkeys:
+            return
+        try:
+            if enabled:
+                keyboard.add_hotkey(SLIDESHOW_NEXT_KEY, lambda: self.call_in_ui(self.slideshow_step, 1))
+                keyboard.add_hotkey(SLIDESHOW_PREV_KEY, lambda: self.call_in_ui(self.slideshow_step, -1))
+            else:
+                keyboard.remove_hotkey(SLIDESHOW_NEXT_KEY)
+                keyboard.remove_hotkey(SLIDESHOW_PREV_KEY)
+            self.slideshow_hotkeys = enabled
+        except Exception as e:
+            print(f"Ошибка настройки клавиш листания: {e}")
+    
+    def on_slideshow_key(self, event, direction):
+        """Листание стрелками (кроме полей ввода и ползунков - там стрелки свои)"""
+        if isinstance(event.widget, (tk.Entry, tk.Spinbox, tk.Scale, tk.Text, ttk.Entry, ttk.Scale)):
+            return
+        if not self.slideshow.folder:
+            return
+        self.slideshow_step(direction)
+    
+    def update_target_size(self):
+        """Размер превью для выбора уровня многоуровневых файлов (до декодирования)"""
+        canvas_width = self.preview_canvas.winfo_width()
+        canvas_height = self.preview_canvas.winfo_height()
+        if canvas_width > 1 and canvas_height > 1:
+            self.store.target_size = (canvas_width, canvas_height)
+    
+    def display_preview(self):
+        """Отображение превью (масштабирование и эффекты - в фоне)"""
+        if not self.image or self.loading_path:
+            return
+        
+        if self.selection and self.selection['rect']:
+            # Не стираем рамку выделения
+            return
+        
+        if self.batch_depth:
+            self.batch_dirty.add('preview')
+            return
         
         # Получаем размер Canvas
         canvas_width = self.preview_canvas.winfo_width()
@@ -738,22 +3941,63 @@ class ImageOverlayApp:
             self.root.after(100, self.display_preview)
             return
         
+        # Для многоуровневых файлов достаточно уровня размером с превью
+        self.update_target_size()
+        
+        # Рассчитываем размер для превью с учетом масштаба
+        preview_width = int(self.image.width * self.scale_factor)
+        preview_height = int(self.image.height * self.scale_factor)
+        
+        # Центрируем (со сдвигом после масштабирования под курсором)
+        x = (canvas_width - preview_width) // 2 + self.preview_offset[0]
+        y = (canvas_height - preview_height) // 2 + self.preview_offset[1]
+        geometry = (x, y, preview_width, preview_height, canvas_width, canvas_height)
+        
+        # То же самое уже нарисовано или рисуется - ничего не делаем
+        effects = self.effects_snapshot()
+        key = (id(self.image), geometry, self.show_border_var.get(), effects)
+        if key == self.preview_key:
+            return
+        self.preview_key = key
+        
+        # Масштабированный битмап переиспользуем
+        scaled = None
+        cached = self.preview_cache
+        if cached and cached[0] is self.image and cached[1:3] == (preview_width, preview_height):
+            scaled = cached[3]
+        
+        image = self.image
+        if scaled is not None and effects == ((), None):
+            # Готовый битмап без эффектов рисуем сразу
+            self.scheduler.cancel('preview')
+            self.show_preview(image, geometry, (scaled, scaled))
+            return
+        
+        self.scheduler.submit('preview', self.render_bitmap,
+                              (image, preview_width, preview_height, scaled, effects),
+                              on_done=lambda result: self.show_preview(image, geometry, result))
+    
+    def show_preview(self, image, geometry, result):
+        """Вывод готового битмапа превью на Canvas"""
+        if image is not self.image or self.loading_path or self.selection and self.selection['rect']:
+            self.preview_key = None
+            return
+        
+        x, y, preview_width, preview_height, canvas_width, canvas_height = geometry
+        scaled, bitmap = result
+        if not self.preview_cache or self.preview_cache[3] is not scaled:
+            self.preview_cache = (image, preview_width, preview_height, scaled)
+            self.store.track('preview', scaled)
+        self.save_preview_thumbnails()
+        
+        # Очищаем Canvas (временное превью из кэша больше не нужно)
+        self.preview_canvas.delete("all")
+        self.preview_placeholder = None
+        
         try:
-            # Рассчитываем размер для превью с учетом масштаба
-            preview_width = int(self.image.width * self.scale_factor)
-            preview_height = int(self.image.height * self.scale_factor)
-            
-            # Изменяем размер изображения
-            img_copy = self.image.copy()
-            if preview_width != self.image.width or preview_height != self.image.height:
-                img_copy = img_copy.resize((preview_width, preview_height), Image.Resampling.LANCZOS)
-            
             # Конвертируем для Tkinter
-            self.photo_image = ImageTk.PhotoImage(img_copy)
-            
-            # Центрируем
-            x = (canvas_width - preview_width) // 2
-            y = (canvas_height - preview_height) // 2
+            self.photo_image = ImageTk.PhotoImage(bitmap)
+            self.preview_origin = (x, y)
             
             # Отображаем
             self.preview_canvas.create_image(x, y, anchor=tk.NW, image=self.photo_image)
@@ -766,6 +4010,12 @@ class ImageOverlayApp:
                                                    outline=self.colors['primary'], 
                                                    width=2)
             
+            # Граница шторки
+            if self.comparer.active and self.comparer.mode == 'split':
+                split_x = x + int(preview_width * self.comparer.factor)
+                self.preview_canvas.create_line(split_x, y, split_x, y + preview_height,
+                                              fill=self.colors['warning'], width=2)
+            
             # Отображаем информацию о масштабе
             if abs(self.scale_factor - 1.0) > 0.01:
                 scale_text = f"Масштаб: {self.scale_factor:.1f}x"
@@ -785,6 +4035,14 @@ class ImageOverlayApp:
         except Exception as e:
             print(f"Ошибка отображения превью: {e}")
     
+    def save_preview_thumbnails(self):
+        """Превью и миниатюра нового файла - в дисковый кэш для следующего открытия"""
+        cached = self.preview_cache
+        if self.thumbnail_due and self.thumbnail_due == self.image_path and cached and cached[0] is self.image:
+            self.disk_cache.put(self.image_path, 'preview', cached[3], (DISK_PREVIEW_MAX, DISK_PREVIEW_MAX))
+            self.disk_cache.put(self.image_path, 'thumb', cached[3], THUMBNAIL_SIZE)
+            self.thumbnail_due = None
+    
     def save_image(self):
         """Сохранение изображения"""
         if not self.image:
@@ -798,12 +4056,6 @@ class ImageOverlayApp:
         except:
             width, height = self.image.size
         
-        # Изменяем размер если нужно
-        if width != self.image.width or height != self.image.height:
-            img_to_save = self.image.resize((width, height), Image.Resampling.LANCZOS)
-        else:
-            img_to_save = self.image
-        
         # Сохраняем
         try:
             file_path = filedialog.asksaveasfilename(
@@ -817,27 +4069,78 @@ class ImageOverlayApp:
             )
             
             if file_path:
-                img_to_save.save(file_path)
-                self.update_status(f"Сохранено: {os.path.basename(file_path)}")
+                # Уменьшенную или переведенную в профиль экрана копию не сохраняем
+                source = self.store.export_source((width, height))
+                if source:
+                    self.update_status("Чтение исходника...")
+                else:
+                    self.update_status(f"Сохранение: {os.path.basename(file_path)}...")
+                
+                # Повторное сохранение в тот же файл отменяет предыдущее
+                self.scheduler.submit(('export', file_path), self.render_export,
+                                      (self.image, source, width, height, file_path),
+                                      on_done=lambda result: self.update_status(f"Сохранено: {os.path.basename(file_path)}"),
+                                      on_error=lambda e: messagebox.showerror("Ошибка", f"Не удалось сохранить:\n{str(e)}"))
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось сохранить:\n{str(e)}")
     
-    def clear_image(self):
-        """Очистка изображения"""
-        if self.image:
-            if messagebox.askyesno("Подтверждение", "Удалить текущее изображение?"):
-                self.image = None
-                self.photo_image = None
-                self.preview_canvas.delete("all")
-                self.preview_canvas.create_text(400, 200,
-                                               text="Перетащите изображение сюда\nили нажмите 'Загрузить изображение'",
-                                               fill='#7f8c8d',
-                                               font=('Segoe UI', 12),
-                                               justify=tk.CENTER,
-                                               tags="placeholder")
-                self.image_info.config(text="Нет изображения")
-                self.scale_factor = 1.0
-                self.update_status("Изображение удалено")
+    def render_export(self, check, image, source, width, height, file_path):
+        """Подготовка и запись сохраняемого файла (в фоновом потоке)
+        
+        source - чтение исходника (см. ImageStore.export_source) или None.
+        Встраивается профиль исходника, а не профиль экрана этой машины.
+        """
+        if source:
+            decoded = source()
+            image, icc = decoded['image'], decoded['icc']
+        else:
+            icc = image.info.get('icc_profile')
+        check()
+        
+        # Изменяем размер если нужно
+        img_to_save = scale_bitmap(image, width, height)
+        check()
+        if icc:
+            img_to_save.save(file_path, icc_profile=icc)
+        else:
+            img_to_save.save(file_path)
+    
+    def clear_image(self, confirm=True):
+        """Очистка изображения (confirm=False - без вопроса, для скриптов)"""
+        if not self.image and not self.loading_path:
+            return
+        if confirm and not messagebox.askyesno("Подтверждение", "Удалить текущее изображение?"):
+            return
+        
+        self.record('clear')
+        self.close_region_overlays()
+        self.slideshow.close()
+        self.set_slideshow_hotkeys(False)
+        self.image = None
+        self.image_path = None
+        self.image_name = None
+        self.store.clear()
+        self.load_generation += 1
+        self.loading_path = None
+        self.level_request = None
+        self.scheduler.cancel('load')
+        self.scheduler.cancel('level')
+        self.photo_image = None
+        self.preview_placeholder = None
+        self.preview_cache = None
+        self.preview_key = None
+        self.scheduler.cancel('preview')
+        self.preview_canvas.delete("all")
+        self.preview_canvas.create_text(400, 200,
+                                       text="Перетащите изображение сюда\nили нажмите 'Загрузить изображение'",
+                                       fill='#7f8c8d',
+                                       font=('Segoe UI', 12),
+                                       justify=tk.CENTER,
+                                       tags="placeholder")
+        self.image_info.config(text="Нет изображения")
+        self.scale_factor = 1.0
+        self.preview_offset = [0, 0]
+        self.update_status("Изображение удалено")
     
     def apply_size(self):
         """Применение размера"""
@@ -848,6 +4151,8 @@ class ImageOverlayApp:
             if width <= 0 or height <= 0:
                 raise ValueError("Размер должен быть положительным числом")
             
+            self.record('size', width=width, height=height)
+            
             # Обновляем слайдеры
             self.width_scale.set(width)
             self.height_scale.set(height)
@@ -856,6 +4161,7 @@ class ImageOverlayApp:
             if self.image:
                 self.display_preview()
             
+            self.save_settings()
             self.update_status(f"Размер установлен: {width}×{height}")
             
         except ValueError as e:
@@ -864,37 +4170,47 @@ class ImageOverlayApp:
     def reset_size(self):
         """Сброс размера к оригинальному"""
         if self.image and self.original_size:
-            self.width_scale.set(self.original_size[0])
-            self.height_scale.set(self.original_size[1])
-            self.width_entry.delete(0, tk.END)
-            self.width_entry.insert(0, str(self.original_size[0]))
-            self.height_entry.delete(0, tk.END)
-            self.height_entry.insert(0, str(self.original_size[1]))
+            self.record('reset_size')
+            self.set_size_fields(*self.original_size)
             self.scale_factor = 1.0
+            self.preview_offset = [0, 0]
             self.display_preview()
             self.update_status("Размер сброшен к оригинальному")
     
     def update_position(self):
         """Обновление позиции"""
+        self.overlay_xy = None
         if self.overlay_window:
             self.move_overlay_to_position()
+        self.save_settings()
     
     def toggle_overlay(self):
         """Переключение режима поверх окон"""
-        if not self.image:
+        if not self.image and not self.is_pinned:
             messagebox.showwarning("Внимание", "Сначала загрузите изображение")
             return
         
+        self.record('toggle', pinned=not self.is_pinned)
         self.is_pinned = not self.is_pinned
         
         if self.is_pinned:
+            if self.overlay_window:
+                # Окно еще исчезает - разворачиваем анимацию обратно
+                self.fade_overlay(self.opacity_scale.get() / 100.0)
             self.create_overlay()
+        else:
+            self.hide_overlay()
+        self.update_pin_controls()
+        self.save_settings()
+    
+    def update_pin_controls(self):
+        """Кнопка и индикатор режима поверх окон"""
+        if self.is_pinned:
             self.toggle_btn.config(text="📌 ОТКЛЮЧИТЬ ПОВЕРХ ОКОН", 
                                  bg=self.colors['danger'])
             self.status_indicator.config(fg='#e74c3c')
             self.update_status("Режим поверх окон ВКЛЮЧЕН")
         else:
-            self.destroy_overlay()
             self.toggle_btn.config(text="📌 ВКЛЮЧИТЬ ПОВЕРХ ОКОН", 
                                  bg=self.colors['secondary'])
             self.status_indicator.config(fg='#2ecc71')
@@ -902,14 +4218,63 @@ class ImageOverlayApp:
     
     def create_overlay(self):
         """Создание окна поверх других окон"""
-        if self.overlay_window:
-            self.overlay_window.destroy()
+        if self.batch_depth:
+            self.batch_dirty.add('overlay')
+            return
         
-        try:
-            width = int(self.width_entry.get())
-            height = int(self.height_entry.get())
-        except:
-            width, height = self.image.size
+        # Битмап сразу в физических пикселях монитора - система его не растягивает
+        monitor = self.overlay_monitor()
+        width, height = self.device_size(*self.get_size_fields(self.image.size), monitor)
+        self.overlay_scale = monitor['scale']
+        self.request_level((width, height))
+        
+        # Масштабированный битмап того же размера переиспользуем:
+        # ползунки коррекции и сравнения пересчитывают только эффекты
+        source = (id(self.image), width, height)
+        scaled = self.overlay_base if self.overlay_source == source else None
+        
+        self.scheduler.submit('overlay', self.render_overlay,
+                              (self.image, self.image_path, width, height, scaled, self.effects_snapshot()),
+                              on_done=lambda result: self.show_rendered_overlay(source, result))
+    
+    def render_overlay(self, check, image, path, width, height, scaled, effects):
+        """Битмап окна поверх экрана (в фоновом потоке)"""
+        # Изменяем размер изображения (или берем готовый битмап из кэша)
+        if scaled is None and path:
+            cached = self.disk_cache.get(path, 'overlay')
+            if cached is not None and cached.size == (width, height):
+                scaled = cached
+        if scaled is None:
+            scaled = scale_bitmap(image, width, height)
+            if path:
+                self.disk_cache.put(path, 'overlay', scaled)
+        
+        check()
+        return self.render_bitmap(check, image, width, height, scaled, effects)
+    
+    def show_rendered_overlay(self, source, result):
+        if not self.is_pinned:
+            return
+        
+        scaled, bitmap = result
+        self.overlay_base = scaled
+        self.overlay_source = source
+        self.store.track('overlay', scaled)
+        self.show_overlay_bitmap(bitmap)
+    
+    def show_overlay_bitmap(self, bitmap):
+        """Показ готового битмапа в окне поверх других окон"""
+        # Конвертируем для Tkinter
+        photo = ImageTk.PhotoImage(bitmap)
+        
+        if self.overlay_window:
+            # Окно уже есть - меняем только картинку
+            self.overlay_label.config(image=photo)
+            self.overlay_label.image = photo
+            self.overlay_window.attributes('-topmost', self.always_on_top_var.get())
+            self.set_overlay_alpha(self.opacity_scale.get() / 100.0)
+            self.move_overlay_to_position()
+            return
         
         # Создаем окно
         self.overlay_window = tk.Toplevel(self.root)
@@ -920,20 +4285,15 @@ class ImageOverlayApp:
         
         self.overlay_window.configure(bg='black')
         
-        # Устанавливаем прозрачность
-        opacity = self.opacity_scale.get() / 100.0
-        self.overlay_window.attributes('-alpha', opacity)
-        
-        # Изменяем размер изображения
-        resized_image = self.image.resize((width, height), Image.Resampling.LANCZOS)
-        
-        # Конвертируем для Tkinter
-        photo = ImageTk.PhotoImage(resized_image)
+        # Окно появляется плавно (начинаем с полной прозрачности)
+        self.overlay_window.attributes('-alpha', 0.0)
+        self.fade_overlay(self.opacity_scale.get() / 100.0)
         
         # Создаем Label с изображением
         label = tk.Label(self.overlay_window, image=photo, bg='black')
         label.image = photo
         label.pack()
+        self.overlay_label = label
         
         # Устанавливаем позицию
         self.move_overlay_to_position()
@@ -948,72 +4308,164 @@ class ImageOverlayApp:
     
     def start_move(self, event):
         """Начало перемещения окна"""
-        self.drag_data['x'] = event.x
-        self.drag_data['y'] = event.y
+        # Положение окна запрашиваем у Tk один раз, дальше считаем сами
+        window = event.widget.winfo_toplevel()
+        self.drag_data = {
+            'toplevel': window,
+            'x': event.x_root,
+            'y': event.y_root,
+            'window': (window.winfo_x(), window.winfo_y()),
+            'size': (window.winfo_width(), window.winfo_height()),
+            'monitors': self.displays.get(),
+            'monitor': None,
+            'target': None,
+            'anchor': None,
+            'applied': None,
+            'pending': None,
+            'events': 0,
+            'updates': 0,
+            'started': time.perf_counter(),
+            'last_frame': None,
+            'frame_times': [],
+        }
     
     def on_move(self, event):
-        """Перемещение окна"""
-        x = self.overlay_window.winfo_x() + (event.x - self.drag_data['x'])
-        y = self.overlay_window.winfo_y() + (event.y - self.drag_data['y'])
-        self.overlay_window.geometry(f"+{x}+{y}")
+        """Перемещение окна (геометрия меняется не чаще раза за кадр)"""
+        drag = self.drag_data
+        if 'window' not in drag:
+            return
+        
+        x = drag['window'][0] + event.x_root - drag['x']
+        y = drag['window'][1] + event.y_root - drag['y']
+        
+        # Shift - двигать без прилипания
+        # Прилипание - к позициям монитора под курсором
+        anchor = None
+        monitor = monitor_at(drag['monitors'], event.x_root, event.y_root)
+        if not event.state & 0x0001:
+            left, top, area_width, area_height = monitor['work']
+            x, y, anchor = snap_position(x, y, *drag['size'], area_width, area_height, origin=(left, top))
+        drag['monitor'] = monitor
+        
+        drag['target'] = (x, y)
+        drag['anchor'] = anchor
+        drag['events'] += 1
+        if not drag['pending']:
+            drag['pending'] = self.root.after(DRAG_FRAME_MS, self.apply_drag_frame)
+    
+    def apply_drag_frame(self):
+        """Применение накопленного за кадр перемещения"""
+        drag = self.drag_data
+        drag['pending'] = None
+        if not drag['toplevel'].winfo_exists() or drag['target'] == drag['applied']:
+            return
+        
+        x, y = drag['target']
+        drag['toplevel'].geometry(f"+{x}+{y}")
+        drag['applied'] = drag['target']
+        drag['updates'] += 1
+        
+        now = time.perf_counter()
+        if drag['last_frame'] is not None:
+            drag['frame_times'].append((now - drag['last_frame']) * 1000)
+        drag['last_frame'] = now
     
     def stop_move(self, event):
         """Окончание перемещения окна"""
-        self.drag_data['x'] = 0
-        self.drag_data['y'] = 0
+        drag = self.drag_data
+        if 'window' not in drag:
+            return
+        if drag['pending']:
+            self.root.after_cancel(drag['pending'])
+        if drag['target'] and drag['toplevel'] is self.overlay_window:
+            self.apply_drag_frame()
+            self.record('drag', start=list(drag['window']), target=list(drag['target']),
+                        anchor=drag['anchor'], events=drag['events'])
+            
+            # Запоминаем положение: позицию, если окно прилипло к ней, иначе координаты
+            if drag['anchor']:
+                self.position_var.set(drag['anchor'])
+                self.monitor_var.set(drag['monitors'].index(drag['monitor']))
+                self.overlay_xy = None
+            else:
+                self.overlay_xy = drag['target']
+            self.save_settings()
+            
+            # На мониторе с другим масштабом битмап перестраивается
+            if drag['monitor']['scale'] != self.overlay_scale and self.image:
+                self.create_overlay()
+        elif drag['target']:
+            self.apply_drag_frame()
+        
+        frame_times = drag['frame_times']
+        self.drag_stats = {
+            'events': drag['events'],
+            'updates': drag['updates'],
+            'duration_ms': (time.perf_counter() - drag['started']) * 1000,
+            'avg_frame_ms': sum(frame_times) / len(frame_times) if frame_times else 0.0,
+            'max_frame_ms': max(frame_times, default=0.0),
+        }
+        self.drag_data = {}
+        if drag['events']:
+            self.update_status(
+                f"Перетаскивание: {self.drag_stats['events']} событий мыши, "
+                f"{self.drag_stats['updates']} обновлений окна, "
+                f"кадр {self.drag_stats['avg_frame_ms']:.1f} мс "
+                f"(макс. {self.drag_stats['max_frame_ms']:.1f} мс)")
     
     def move_overlay_to_position(self):
         """Перемещение окна в выбранную позицию"""
         if not self.overlay_window:
             return
         
-        screen_width = self.root.winfo_screenwidth()
-        screen_height = self.root.winfo_screenheight()
+        if self.batch_depth:
+            self.batch_dirty.add('position')
+            return
         
-        try:
-            width = int(self.width_entry.get())
-            height = int(self.height_entry.get())
-        except:
-            width, height = 800, 600
-        
-        position = self.position_var.get()
-        
-        if position == "top-left":
-            x, y = 10, 30
-        elif position == "top-center":
-            x = (screen_width - width) // 2
-            y = 30
-        elif position == "top-right":
-            x = screen_width - width - 10
-            y = 30
-        elif position == "middle-left":
-            x = 10
-            y = (screen_height - height) // 2
-        elif position == "center":
-            x = (screen_width - width) // 2
-            y = (screen_height - height) // 2
-        elif position == "middle-right":
-            x = screen_width - width - 10
-            y = (screen_height - height) // 2
-        elif position == "bottom-left":
-            x = 10
-            y = screen_height - height - 50
-        elif position == "bottom-center":
-            x = (screen_width - width) // 2
-            y = screen_height - height - 50
-        elif position == "bottom-right":
-            x = screen_width - width - 10
-            y = screen_height - height - 50
-        else:
-            x, y = 100, 100
+        # Позиция считается в рабочей области выбранного монитора
+        monitor = self.overlay_monitor()
+        width, height = self.device_size(*self.get_size_fields((800, 600)), monitor)
+        left, top, area_width, area_height = monitor['work']
+        x, y = anchor_point(self.position_var.get(), width, height, area_width, area_height, (left, top))
+        
+        # Окно перетаскивали вручную - держим его там
+        if self.overlay_xy:
+            x, y = self.overlay_xy
         
         self.overlay_window.geometry(f"{width}x{height}+{x}+{y}")
     
+    def fade_overlay(self, target, on_done=None):
+        """Плавное изменение прозрачности окна поверх экрана до target"""
+        window = self.overlay_window
+        self.animator.animate('overlay-alpha', float(window.attributes('-alpha')), target,
+                              FADE_MS / 1000.0,
+                              lambda value: window.attributes('-alpha', value),
+                              on_done)
+    
+    def set_overlay_alpha(self, value):
+        """Прозрачность окна: сразу или как новая цель идущей анимации"""
+        if self.animator.active('overlay-alpha'):
+            self.fade_overlay(value)
+        else:
+            self.overlay_window.attributes('-alpha', value)
+    
+    def hide_overlay(self):
+        """Плавное скрытие окна поверх экрана с последующим уничтожением"""
+        self.scheduler.cancel('overlay')
+        if not self.overlay_window:
+            return
+        self.fade_overlay(0.0, on_done=self.destroy_overlay)
+    
     def destroy_overlay(self):
         """Уничтожение окна поверх окон"""
+        self.animator.cancel('overlay-alpha')
         if self.overlay_window:
             self.overlay_window.destroy()
             self.overlay_window = None
+            self.overlay_label = None
+        self.scheduler.cancel('overlay')
+        self.overlay_base = None
+        self.overlay_source = None
     
     def update_hotkey(self):
         """Обновление горячей клавиши"""
@@ -1028,7 +4480,7 @@ class ImageOverlayApp:
                     pass
                 
                 # Добавляем новый
-                keyboard.add_hotkey(new_bind, self.toggle_overlay)
+                keyboard.add_hotkey(new_bind, self.on_toggle_hotkey)
                 self.bind_key = new_bind
                 self.hotkey_label.config(text=new_bind)
                 
@@ -1042,10 +4494,14 @@ class ImageOverlayApp:
                 self.hotkey_entry.delete(0, tk.END)
                 self.hotkey_entry.insert(0, self.bind_key)
     
+    def on_toggle_hotkey(self):
+        """Горячая клавиша (вызывается в потоке keyboard) - Tk трогаем только из его потока"""
+        self.call_in_ui(self.toggle_overlay)
+    
     def setup_hotkey(self):
         """Настройка горячей клавиши"""
         try:
-            keyboard.add_hotkey(self.bind_key, self.toggle_overlay)
+            keyboard.add_hotkey(self.bind_key, self.on_toggle_hotkey)
         except Exception as e:
             print(f"Ошибка настройки горячей клавиши: {e}")
     
@@ -1054,30 +4510,84 @@ class ImageOverlayApp:
     def load_settings(self):
         """Загрузка настроек"""
         try:
-            if os.path.exists('settings.json'):
-                with open('settings.json', 'r', encoding='utf-8') as f:
-                    settings = json.load(f)
-                    self.bind_key = settings.get('bind_key', 'ctrl+shift+space')
-                    self.position = settings.get('position', 'top-right')
-                    self.hotkey_entry.delete(0, tk.END)
-                    self.hotkey_entry.insert(0, self.bind_key)
-                    self.hotkey_label.config(text=self.bind_key)
-                    self.position_var.set(self.position)
+            settings = self.settings.load(legacy_path='settings.json')
+            self.bind_key = settings.get('bind_key', 'ctrl+shift+space')
+            self.position = settings.get('position', 'top-right')
+            self.hotkey_entry.delete(0, tk.END)
+            self.hotkey_entry.insert(0, self.bind_key)
+            self.hotkey_label.config(text=self.bind_key)
+            self.position_var.set(self.position)
+            self.monitor_var.set(int(settings.get('monitor', 0)))
+            self.update_monitor_list()
+            self.recent_files = settings.get('recent_files', [])[:RECENT_FILES_MAX]
+            cache_mb = settings.get('disk_cache_mb', DISK_CACHE_MAX_MB)
+            self.disk_cache.max_bytes = int(cache_mb) * 1024 * 1024
+            budget_mb = settings.get('memory_budget_mb', MEMORY_BUDGET_MB)
+            self.store.budget_bytes = int(budget_mb) * 1024 * 1024
+            self.set_adjustments(settings.get('adjustments', {}))
         except Exception as e:
             print(f"Ошибка загрузки настроек: {e}")
+        self.settings_loaded = True
     
     def save_settings(self):
-        """Сохранение настроек"""
+        """Сохранение настроек (запись на диск - отложенная, в фоне)"""
+        if not self.settings_loaded:
+            return
+        
+        # Пока файл декодируется (в том числе при восстановлении сессии), в
+        # сессию идет он, а не прежний файл или пустота
+        if self.loading_path:
+            path, size = self.loading_path, self.loading_size
+        else:
+            path, size = self.image_path, self.get_size_fields()
+        
+        self.settings.update({
+            'bind_key': self.bind_key,
+            'position': self.position_var.get(),
+            'monitor': self.monitor_var.get(),
+            'recent_files': self.recent_files,
+            'disk_cache_mb': self.disk_cache.max_bytes // (1024 * 1024),
+            'memory_budget_mb': self.store.budget_bytes // (1024 * 1024),
+            'adjustments': dict(self.adjustments.params),
+            'session': {
+                'path': path,
+                'size': size,
+                'opacity': self.opacity_scale.get(),
+                'topmost': self.always_on_top_var.get(),
+                'border': self.show_border_var.get(),
+                'pinned': self.is_pinned,
+                'overlay_xy': self.overlay_xy,
+            },
+        })
+    
+    def restore_session(self):
+        """Восстановление прошлой сессии: файл, размер, прозрачность, окно поверх"""
+        session = self.settings.data.get('session') or {}
+        path = session.get('path')
+        if not path or not os.path.isfile(path):
+            return
+        
         try:
-            settings = {
-                'bind_key': self.bind_key,
-                'position': self.position_var.get(),
-                'last_saved': datetime.now().isoformat()
-            }
-            with open('settings.json', 'w', encoding='utf-8') as f:
-                json.dump(settings, f, ensure_ascii=False, indent=2)
+            self.opacity_scale.set(session.get('opacity', 100))
+            self.always_on_top_var.set(session.get('topmost', True))
+            self.show_border_var.set(session.get('border', True))
+            if session.get('overlay_xy'):
+                self.overlay_xy = tuple(session['overlay_xy'])
+            size = tuple(session['size']) if session.get('size') else None
+            
+            # Окно поверх экрана - сразу из готового битмапа, до декодирования файла.
+            # Если битмапа в кэше нет, окно появится после загрузки файла
+            if session.get('pinned') and size:
+                self.set_size_fields(*size)
+                self.is_pinned = True
+                bitmap = self.disk_cache.get(path, 'overlay')
+                if bitmap is not None and bitmap.size == self.device_size(*size):
+                    self.show_overlay_bitmap(bitmap)
+                self.update_pin_controls()
+            
+            self.load_image_file(path, size=size)
         except Exception as e:
-            print(f"Ошибка сохранения настроек: {e}")
+            print(f"Ошибка восстановления сессии: {e}")
     
     def show_about(self):
         """Показать информацию о программе"""
@@ -1099,24 +4609,87 @@ class ImageOverlayApp:
         except:
             pass
         
-        self.destroy_overlay()
+        if self.instance_server:
+            self.instance_server.close()
+        if self.recorder:
+            self.recorder.close()
+        
         self.save_settings()
+        self.settings.flush()
+        self.destroy_overlay()
+        self.close_region_overlays()
         
         self.root.quit()
         self.root.destroy()
 
+def parse_args(argv=None):
+    """Разбор аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Image to Fix Pro")
+    parser.add_argument('files', nargs='*',
+                        help="изображения для открытия ('-' - прочитать из stdin)")
+    parser.add_argument('--stream', action='store_true',
+                        help="читать из stdin поток кадров: 4 байта длины (big-endian) и изображение")
+    parser.add_argument('--new-instance', action='store_true',
+                        help="не передавать файлы уже запущенной программе")
+    parser.add_argument('--control', action='store_true',
+                        help="разрешить управление из скриптов (см. itf_client.py)")
+    parser.add_argument('--record', metavar='ФАЙЛ',
+                        help="записывать действия в файл для повтора (см. itf_replay.py)")
+    return parser.parse_args(argv)
+
 def main():
     """Основная функция"""
     try:
+        args = parse_args()
+        read_stdin = '-' in args.files
+        files = [os.path.abspath(f) for f in args.files if f != '-']
+        if read_stdin and args.stream:
+            print("Ошибка: '-' и --stream вместе не используются")
+            return
+        
+        # Изображение из stdin читаем целиком сразу - оно не зависит от окна
+        data = sys.stdin.buffer.read() if read_stdin else None
+        
+        # Если программа уже запущена - отдаем ей файлы (и данные) и выходим
+        if not args.new_instance:
+            conn = connect_to_instance()
+            if conn is not None:
+                with conn:
+                    reply = request_instance(conn, {'cmd': 'open', 'files': files})
+                    if reply.get('ok') and data:
+                        reply = request_instance(conn, {'cmd': 'image', 'name': "stdin"}, data)
+                    if reply.get('ok') and args.stream:
+                        # Каждый кадр ждет подтверждения - программа задает темп
+                        try:
+                            for frame in read_frames(sys.stdin.buffer):
+                                reply = request_instance(conn, {'cmd': 'image', 'name': "stream"}, frame)
+                                if not reply.get('ok'):
+                                    break
+                        except ValueError as e:
+                            reply = {'ok': False, 'error': str(e)}
+                    if not reply.get('ok'):
+                        print(f"Ошибка: {reply.get('error')}")
+                return
+        
+        profiler = StartupProfiler()
+        enable_dpi_awareness()
         root = tk.Tk()
-        app = ImageOverlayApp(root)
+        profiler.mark("tk")
+        app = ImageOverlayApp(root, profiler)
         
-        # Обновляем превью после отрисовки окна
-        def update_preview():
-            app.display_preview()
-            root.after(100, update_preview)
+        app.control_enabled = args.control
+        if args.record:
+            app.start_recording(os.path.abspath(args.record))
+        if not args.new_instance:
+            app.start_instance_server()
+        app.open_files(files)
+        if data:
+            root.after_idle(app.load_image_bytes, data, "stdin")
+        if args.stream:
+            threading.Thread(target=app.read_stream, args=(sys.stdin.buffer,),
+                             name="itf-stream", daemon=True).start()
         
-        root.after(100, update_preview)
+        # Превью перерисовывается по изменению размера Canvas (<Configure>)
         root.mainloop()
         
     except Exception as e:
@@ -0,0 +1,98 @@
+"""Замер стоимости управления цветом (ICC) в Image to Fix Pro.
+
+Показывает время построения преобразования ImageCms (первое и из кэша) и
+время перевода рабочей копии в профиль экрана в миллисекундах на мегапиксель:
+
+    python itf_bench.py
+    python itf_bench.py photo_adobe_rgb.jpg wide_gamut.png --repeat 10
+
+Без файлов замеряются синтетические изображения со встроенным профилем sRGB
+(Pillow не умеет создавать широкоохватные профили); на sRGB-экране их
+перевод пропускается, и замерено будет только построение. Для точной оценки
+передайте свои файлы со встроенными профилями.
+"""
+import sys
+import time
+import argparse
+
+from itf import ColorManager, Image, ImageCms, open_image
+
+
+# Синтетические изображения: мегапиксели и режимы
+SYNTHETIC_MEGAPIXELS = (1, 4, 12)
+SYNTHETIC_MODES = ('RGB', 'RGBA')
+
+
+def synthetic_images():
+    """(название, изображение, профиль) для встроенного набора"""
+    icc = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+    for megapixels in SYNTHETIC_MEGAPIXELS:
+        width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+        height = megapixels * 1_000_000 // width
+        noise = Image.effect_noise((width, height), 64)
+        for mode in SYNTHETIC_MODES:
+            yield f"{megapixels} Мп {mode}", noise.convert(mode), icc
+
+
+def file_images(paths):
+    """(название, изображение, профиль) для файлов со встроенным профилем"""
+    for path in paths:
+        image = open_image(path)
+        icc = image.info.get('icc_profile')
+        image.load()
+        if not icc:
+            print(f"{path}: нет встроенного ICC-профиля, пропущен")
+            continue
+        yield path, image, icc
+
+
+def measure(image, icc, repeat):
+    """Время построения преобразования и перевода (лучшее из repeat, None - перевода нет)"""
+    manager = ColorManager()
+    manager.display_profile()
+
+    start = time.perf_counter()
+    manager.transform_for(icc, image.mode)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    transform = manager.transform_for(icc, image.mode)
+    cached_ms = (time.perf_counter() - start) * 1000
+    if transform is None:
+        # Профиль совпадает с профилем экрана - переводить нечего
+        return build_ms, cached_ms, None, None
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        manager.convert(image, icc)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+
+    megapixels = image.width * image.height / 1_000_000
+    return build_ms, cached_ms, best, best / megapixels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер управления цветом Image to Fix Pro")
+    parser.add_argument('files', nargs='*', help="изображения со встроенными ICC-профилями")
+    parser.add_argument('--repeat', type=int, default=5, help="повторов перевода (берется лучший)")
+    args = parser.parse_args(argv)
+
+    images = file_images(args.files) if args.files else synthetic_images()
+
+    print(f"{'Изображение':<28} {'построение':>11} {'из кэша':>9} {'перевод':>10} {'мс/Мп':>8}")
+    for name, image, icc in images:
+        if image.mode not in ColorManager.OUTPUT_MODES:
+            print(f"{name}: режим {image.mode} не переводится, пропущен")
+            continue
+        build_ms, cached_ms, convert_ms, per_megapixel = measure(image, icc, max(1, args.repeat))
+        if convert_ms is None:
+            print(f"{name:<28} {build_ms:>9.2f}мс {cached_ms:>7.3f}мс  профиль совпадает с экраном, перевода нет")
+            continue
+        print(f"{name:<28} {build_ms:>9.2f}мс {cached_ms:>7.3f}мс {convert_ms:>8.1f}мс {per_megapixel:>8.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
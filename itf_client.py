@@ -0,0 +1,66 @@
+"""Клиент управления Image to Fix Pro из скриптов.
+
+Программа должна быть запущена с флагом --control. Все команды одного
+вызова отправляются одним пакетом и применяются за одну перерисовку:
+
+    python itf_client.py load=diff.png size=900x600 move=top-right opacity=60 pin=on
+    python itf_client.py --file batch.json
+    python itf_client.py status
+"""
+import sys
+import json
+import argparse
+
+from itf import send_to_instance
+
+
+def parse_command(token):
+    """Разбор команды вида имя=значение"""
+    name, _, value = token.partition('=')
+
+    if name == 'load':
+        return {'cmd': 'load', 'path': value}
+    if name == 'pin':
+        return {'cmd': 'pin', 'on': value.lower() not in ('off', '0', 'false', 'no')}
+    if name == 'move':
+        return {'cmd': 'move', 'position': value}
+    if name == 'size':
+        width, _, height = value.lower().partition('x')
+        return {'cmd': 'size', 'width': int(width), 'height': int(height)}
+    if name == 'opacity':
+        return {'cmd': 'opacity', 'value': int(value)}
+    if name in ('toggle', 'reset_size', 'status'):
+        return {'cmd': name}
+    raise ValueError(f"Неизвестная команда: {token}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Управление Image to Fix Pro")
+    parser.add_argument('commands', nargs='*',
+                        help="команды: load=ПУТЬ pin=on|off move=ПОЗИЦИЯ size=ШxВ opacity=N toggle reset_size status")
+    parser.add_argument('--file', help="JSON-файл со списком команд")
+    args = parser.parse_args(argv)
+
+    try:
+        commands = [parse_command(token) for token in args.commands]
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            commands.extend(json.load(f))
+
+    if not commands:
+        commands = [{'cmd': 'status'}]
+
+    reply = send_to_instance({'cmd': 'batch', 'commands': commands})
+    if reply is None:
+        print("Программа не запущена")
+        return 2
+
+    print(json.dumps(reply, ensure_ascii=False, indent=2))
+    return 0 if reply.get('ok') else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,360 @@
+"""Повтор записанных действий Image to Fix Pro с замером задержек.
+
+Запись делает сама программа:
+
+    python itf.py --record session.jsonl
+
+Повтор запускает программу в том же процессе, выполняет действия из записи
+(загрузка, масштабирование превью, размер, окно поверх экрана,
+перетаскивание, прозрачность, коррекция, размер окна) и для каждого
+действия меряет время до момента, когда программа затихла: фоновые задачи
+выполнены, очередь интерфейса пуста, анимации закончились. Итог - p50, p95,
+p99 и максимум по каждому виду действий.
+
+Без DISPLAY на Linux сам запускает Xvfb:
+
+    python itf_replay.py session.jsonl                 # в исходном темпе
+    python itf_replay.py session.jsonl --speed 4       # в 4 раза быстрее
+    python itf_replay.py session.jsonl --speed 0 --fail-p95 120 --report replay.json
+    python itf_replay.py session.jsonl --map /home/user/mocks=./mocks
+
+--speed 0 - действия подряд, каждое после завершения предыдущего; иначе
+действия идут по времени записи и могут накладываться, как у пользователя.
+"""
+import os
+import sys
+import math
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import tkinter as tk
+from types import SimpleNamespace
+
+from itf_soak import start_xvfb
+
+
+# Сколько ждать затихания программы после действия, с
+REPLAY_STEP_TIMEOUT = 10.0
+
+# Перцентили в отчете
+REPLAY_PERCENTILES = (50, 95, 99)
+
+
+def load_trace(path):
+    """Заголовок и список действий из файла записи"""
+    from itf import TRACE_VERSION
+
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [line for line in f if line.strip()]
+    if not lines:
+        raise ValueError(f"Пустая запись: {path}")
+
+    header = json.loads(lines[0])
+    if header.get('version') != TRACE_VERSION:
+        raise ValueError(f"Неизвестная версия записи: {header.get('version')}")
+    actions = [json.loads(line) for line in lines[1:]]
+    return header, actions
+
+
+def percentile(values, p):
+    """Перцентиль по ближайшему рангу (values отсортированы)"""
+    if not values:
+        return None
+    rank = max(1, math.ceil(p / 100.0 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def summarize(values):
+    values = sorted(values)
+    summary = {'count': len(values)}
+    for p in REPLAY_PERCENTILES:
+        summary[f'p{p}'] = percentile(values, p)
+    summary['max'] = values[-1] if values else None
+    return summary
+
+
+def parse_map(items):
+    """Замены путей вида СТАРЫЙ=НОВЫЙ"""
+    mapping = []
+    for item in items:
+        old, sep, new = item.partition('=')
+        if not sep or not old:
+            raise ValueError(f"Неверная замена пути: {item}")
+        mapping.append((old, new))
+    return mapping
+
+
+class TraceReplayer:
+    """Выполнение записанных действий поверх живого ImageOverlayApp"""
+    def __init__(self, root, app, path_map=(), timeout=REPLAY_STEP_TIMEOUT):
+        self.root = root
+        self.app = app
+        self.path_map = path_map
+        self.timeout = timeout
+        self.latencies = {}
+        self.skipped = {}
+        self.timeouts = {}
+
+    def pump(self, condition, timeout=REPLAY_STEP_TIMEOUT):
+        """Обработка событий Tk, пока не выполнится condition"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            self.root.update()
+            if condition():
+                return True
+            time.sleep(0.001)
+        return False
+
+    def map_path(self, path):
+        for old, new in self.path_map:
+            if path.startswith(old):
+                return new + path[len(old):]
+        return path
+
+    def count(self, counter, action):
+        counter[action] = counter.get(action, 0) + 1
+
+    def dispatch(self, entry):
+        """Выполнение одного действия; False - пропущено (нечего делать в этом состоянии)"""
+        app = self.app
+        action, args = entry['action'], entry.get('args', {})
+
+        if action == 'load':
+            path = self.map_path(args['path'])
+            if not os.path.isfile(path):
+                print(f"⚠ файл не найден, загрузка пропущена: {path}")
+                return False
+            size = args.get('size')
+            app.load_image_file(path, show_errors=False, size=tuple(size) if size else None)
+
+        elif action == 'zoom':
+            if not app.image:
+                return False
+            if 'x' in args:
+                app.on_preview_zoom(args['steps'],
+                                    app.preview_canvas.winfo_rootx() + args['x'],
+                                    app.preview_canvas.winfo_rooty() + args['y'])
+            else:
+                app.on_preview_zoom(args['steps'])
+
+        elif action == 'size':
+            app.set_size_fields(args['width'], args['height'])
+            app.apply_size()
+
+        elif action == 'reset_size':
+            if not app.image:
+                return False
+            app.reset_size()
+
+        elif action == 'toggle':
+            # Без изображения программа показала бы предупреждение
+            if args.get('pinned') == app.is_pinned or (not app.image and not app.is_pinned):
+                return False
+            app.toggle_overlay()
+
+        elif action == 'drag':
+            if not app.overlay_window or not app.overlay_label:
+                return False
+            self.drag(args)
+
+        elif action == 'window':
+            self.root.geometry(f"{args['width']}x{args['height']}")
+
+        elif action == 'opacity':
+            app.opacity_scale.set(args['value'])
+            app.on_opacity_change(args['value'])
+
+        elif action == 'adjust':
+            name, value = args['name'], args['value']
+            if name in app.adjustment_scales:
+                app.adjustment_scales[name].set(value)
+            elif name in app.adjustment_vars:
+                app.adjustment_vars[name].set(value)
+            elif name == 'tint_color':
+                app.tint_button.config(bg=value)
+            app.on_adjustment_change(name, value)
+
+        elif action == 'clear':
+            if not app.image:
+                return False
+            app.clear_image(confirm=False)
+
+        else:
+            print(f"⚠ неизвестное действие пропущено: {action}")
+            return False
+        return True
+
+    def drag(self, args):
+        """Перетаскивание окна поверх экрана синтетическими событиями мыши.
+
+        Сдвиг берется из записи, начало - текущее положение окна. Если окно
+        тогда не прилипло к позиции, события идут с Shift (без прилипания).
+        """
+        window = self.app.overlay_window
+        x, y = window.winfo_x(), window.winfo_y()
+        dx = args['target'][0] - args['start'][0]
+        dy = args['target'][1] - args['start'][1]
+        state = 0 if args.get('anchor') else 0x0001
+        steps = max(1, args.get('events', 1))
+
+        def event(fraction):
+            return SimpleNamespace(widget=self.app.overlay_label, state=state,
+                                   x_root=x + round(dx * fraction), y_root=y + round(dy * fraction))
+
+        self.app.start_move(event(0))
+        for step in range(1, steps + 1):
+            self.app.on_move(event(step / steps))
+        self.app.stop_move(event(1))
+
+    def run(self, actions, speed=1.0):
+        """Повтор: speed 0 - подряд, иначе в темпе записи, ускоренном в speed раз"""
+        if speed <= 0:
+            for entry in actions:
+                started = time.perf_counter()
+                if not self.dispatch(entry):
+                    self.count(self.skipped, entry['action'])
+                    continue
+                if self.pump(lambda: not self.app.busy(), self.timeout):
+                    self.latencies.setdefault(entry['action'], []).append(
+                        (time.perf_counter() - started) * 1000)
+                else:
+                    self.count(self.timeouts, entry['action'])
+            return
+
+        # Действия по времени записи; задержка каждого - до ближайшего затихания
+        first = actions[0]['t'] if actions else 0.0
+        started = time.perf_counter()
+        index, pending = 0, []
+        while index < len(actions) or pending:
+            while index < len(actions) and time.perf_counter() - started >= (actions[index]['t'] - first) / speed:
+                entry = actions[index]
+                index += 1
+                dispatched = time.perf_counter()
+                if self.dispatch(entry):
+                    pending.append((entry['action'], dispatched))
+                else:
+                    self.count(self.skipped, entry['action'])
+
+            self.root.update()
+            now = time.perf_counter()
+            if pending and not self.app.busy():
+                for action, dispatched in pending:
+                    self.latencies.setdefault(action, []).append((now - dispatched) * 1000)
+                pending = []
+            elif pending and now - pending[0][1] > self.timeout:
+                for action, _ in pending:
+                    self.count(self.timeouts, action)
+                pending = []
+            time.sleep(0.001)
+
+    def report(self):
+        """Сводка задержек по видам действий и по всем вместе"""
+        actions = {name: summarize(values) for name, values in sorted(self.latencies.items())}
+        actions['all'] = summarize([value for values in self.latencies.values() for value in values])
+        return actions
+
+
+def print_report(report, skipped, timeouts):
+    def ms(value):
+        return f"{value:>8.1f}" if value is not None else f"{'-':>8}"
+
+    print(f"{'Действие':<12} {'число':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'макс.':>8}  мс")
+    for name, summary in report.items():
+        print(f"{name:<12} {summary['count']:>6} {ms(summary['p50'])} {ms(summary['p95'])} "
+              f"{ms(summary['p99'])} {ms(summary['max'])}")
+    if skipped:
+        print("Пропущено: " + ", ".join(f"{name} {count}" for name, count in sorted(skipped.items())))
+    if timeouts:
+        print("Не завершились: " + ", ".join(f"{name} {count}" for name, count in sorted(timeouts.items())))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Повтор записанных действий Image to Fix Pro")
+    parser.add_argument('trace', help="файл записи (python itf.py --record ФАЙЛ)")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="ускорение темпа записи (0 - действия подряд без пауз)")
+    parser.add_argument('--map', action='append', default=[], metavar='СТАРЫЙ=НОВЫЙ',
+                        help="замена начала путей к изображениям")
+    parser.add_argument('--timeout', type=float, default=REPLAY_STEP_TIMEOUT,
+                        help="сколько ждать завершения действия, с")
+    parser.add_argument('--fail-p95', type=float, metavar='МС',
+                        help="код выхода 1, если p95 какого-либо действия больше")
+    parser.add_argument('--report', help="JSON-файл с результатами")
+    args = parser.parse_args(argv)
+
+    try:
+        header, actions = load_trace(args.trace)
+        path_map = parse_map(args.map)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка: {e}")
+        return 2
+
+    xvfb = None
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        xvfb = start_xvfb()
+        if xvfb is None:
+            print("Нет DISPLAY и не удалось запустить Xvfb")
+            return 2
+
+    # Настройки и кэш - во временной папке: повтор начинается с чистого состояния
+    workdir = tempfile.mkdtemp(prefix='itf-replay-')
+    for name in ('XDG_CONFIG_HOME', 'XDG_CACHE_HOME', 'APPDATA', 'LOCALAPPDATA'):
+        os.environ[name] = os.path.join(workdir, name.lower())
+
+    try:
+        from itf import ImageOverlayApp
+
+        root = tk.Tk()
+        app = ImageOverlayApp(root)
+        replayer = TraceReplayer(root, app, path_map, args.timeout)
+        replayer.pump(lambda: app.controls_ready)
+        app.ensure_controls()
+
+        # Окно - того же размера, что при записи
+        if header.get('window'):
+            root.geometry("{}x{}".format(*header['window']))
+        replayer.pump(lambda: not app.busy())
+
+        started = time.perf_counter()
+        replayer.run(actions, args.speed)
+        elapsed = time.perf_counter() - started
+
+        report = replayer.report()
+        print(f"Запись: {args.trace}, действий {len(actions)}, темп "
+              f"{'подряд' if args.speed <= 0 else f'x{args.speed:g}'}, {elapsed:.1f} с")
+        print_report(report, replayer.skipped, replayer.timeouts)
+
+        problems = []
+        if replayer.timeouts:
+            problems.append(f"не завершились за {args.timeout:g} с: {sum(replayer.timeouts.values())}")
+        if args.fail_p95 is not None:
+            for name, summary in report.items():
+                if summary['p95'] is not None and summary['p95'] > args.fail_p95:
+                    problems.append(f"{name}: p95 {summary['p95']:.1f} мс (порог {args.fail_p95:g} мс)")
+
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump({'trace': args.trace, 'header': header, 'speed': args.speed,
+                           'elapsed_s': round(elapsed, 3), 'actions': report,
+                           'skipped': replayer.skipped, 'timeouts': replayer.timeouts,
+                           'render': app.scheduler.snapshot(), 'animation': dict(app.animator.stats),
+                           'problems': problems},
+                          f, ensure_ascii=False, indent=2)
+
+        app.on_closing()
+        if problems:
+            for problem in problems:
+                print(f"❌ {problem}")
+            return 1
+        print("✅ Задержки в пределах порогов" if args.fail_p95 is not None else "✅ Повтор завершен")
+        return 0
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if xvfb is not None:
+            xvfb.terminate()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""Длительная проверка Image to Fix Pro на утечки памяти и ресурсов Tk.
+
+Запускает программу в том же процессе и по кругу выполняет сценарий:
+загрузка, масштабирование превью, изменение размера, включение и
+выключение окна поверх экрана, очистка. Периодически снимает RSS процесса,
+объем памяти по tracemalloc, число живых изображений Tk (image names) и
+окон верхнего уровня. Если после прогрева рост больше порогов - код выхода 1.
+
+Без DISPLAY на Linux сам запускает Xvfb:
+
+    python itf_soak.py --minutes 240
+    python itf_soak.py --cycles 200 --images ~/Pictures/mocks --report soak.json
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+import tkinter as tk
+
+
+# Сценарий одного цикла: размеры окна поверх экрана и окна программы
+SOAK_OVERLAY_SIZES = ((640, 480), (1280, 720))
+SOAK_WINDOW_SIZES = ("1200x800", "1000x700")
+
+# Сколько ждать завершения фоновой работы после шага, с
+SOAK_STEP_TIMEOUT = 10.0
+
+
+def start_xvfb():
+    """Запуск Xvfb на свободном дисплее; возвращает процесс или None"""
+    binary = shutil.which('Xvfb')
+    if not binary:
+        return None
+
+    for number in range(99, 140):
+        if os.path.exists(f"/tmp/.X11-unix/X{number}") or os.path.exists(f"/tmp/.X{number}-lock"):
+            continue
+        process = subprocess.Popen([binary, f":{number}", '-screen', '0', '1920x1080x24', '-nolisten', 'tcp'],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            if os.path.exists(f"/tmp/.X11-unix/X{number}"):
+                os.environ['DISPLAY'] = f":{number}"
+                return process
+            if process.poll() is not None:
+                break
+            time.sleep(0.05)
+        process.terminate()
+    return None
+
+
+def rss_bytes():
+    """Текущий RSS процесса (None, если узнать нельзя)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def make_images(folder):
+    """Набор синтетических изображений разных форматов и размеров"""
+    from PIL import Image
+
+    paths = []
+    specs = (('photo.jpg', 'RGB', (4000, 3000)),
+             ('screen.png', 'RGBA', (1920, 1080)),
+             ('mock.png', 'RGB', (1440, 900)),
+             ('scan.tiff', 'L', (2480, 3508)))
+    for name, mode, size in specs:
+        image = Image.effect_noise(size, 40).convert(mode)
+        path = os.path.join(folder, name)
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def list_images(folder):
+    from itf import IMAGE_EXTENSIONS
+
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+class SoakRunner:
+    """Сценарий нагрузки поверх живого ImageOverlayApp"""
+    def __init__(self, root, app, images):
+        self.root = root
+        self.app = app
+        self.images = images
+        self.cycle = 0
+
+    def pump(self, condition=None, minimum=0.0, timeout=SOAK_STEP_TIMEOUT):
+        """Обработка событий Tk, пока не выполнится condition и не затихнет фоновая работа"""
+        start = time.monotonic()
+        while True:
+            self.root.update()
+            elapsed = time.monotonic() - start
+            if elapsed >= minimum and not self.app.busy() and (condition is None or condition()):
+                return True
+            if elapsed > timeout:
+                print(f"⚠ цикл {self.cycle}: шаг не завершился за {timeout:.0f} с")
+                return False
+            time.sleep(0.005)
+
+    def run_cycle(self):
+        app = self.app
+        path = self.images[self.cycle % len(self.images)]
+        self.cycle += 1
+
+        # Загрузка
+        app.load_image_file(path, show_errors=False)
+        self.pump(lambda: app.image_path == path and not app.loading_path)
+
+        # Масштабирование превью
+        for steps in (1, 1, 1, -1, -1, -1):
+            app.on_preview_zoom(steps)
+            self.pump(minimum=0.02)
+
+        # Размер окна поверх экрана и окна программы
+        width, height = SOAK_OVERLAY_SIZES[self.cycle % len(SOAK_OVERLAY_SIZES)]
+        app.set_size_fields(width, height)
+        app.apply_size()
+        self.root.geometry(SOAK_WINDOW_SIZES[self.cycle % len(SOAK_WINDOW_SIZES)])
+        self.pump(minimum=0.05)
+
+        # Окно поверх экрана: включить, выключить
+        app.toggle_overlay()
+        self.pump(lambda: app.overlay_window is not None, minimum=0.05)
+        app.toggle_overlay()
+        self.pump(lambda: app.overlay_window is None, minimum=0.05)
+
+        # Очистка
+        app.clear_image(confirm=False)
+        self.pump(minimum=0.02)
+
+    def sample(self, started):
+        toplevels = [widget for widget in self.root.winfo_children() if isinstance(widget, tk.Toplevel)]
+        traced, _ = tracemalloc.get_traced_memory()
+        rss = rss_bytes()
+        return {
+            'cycle': self.cycle,
+            'elapsed_s': round(time.monotonic() - started, 1),
+            'rss_mb': round(rss / 1024 / 1024, 1) if rss is not None else None,
+            'traced_mb': round(traced / 1024 / 1024, 2),
+            'tk_images': len(self.root.tk.call('image', 'names')),
+            'toplevels': len(toplevels),
+            'threads': threading.active_count(),
+            'render': self.app.scheduler.snapshot(),
+        }
+
+
+def print_sample(sample):
+    rss = f"{sample['rss_mb']:.1f} МБ" if sample['rss_mb'] is not None else "?"
+    print(f"цикл {sample['cycle']:>5} | {sample['elapsed_s']:>8.1f} с | RSS {rss} | "
+          f"tracemalloc {sample['traced_mb']:.2f} МБ | изображений Tk {sample['tk_images']} | "
+          f"окон {sample['toplevels']} | потоков {sample['threads']}")
+
+
+def check_growth(baseline, last, args):
+    """Список нарушений порогов роста"""
+    problems = []
+    if baseline['rss_mb'] is not None and last['rss_mb'] is not None:
+        growth = last['rss_mb'] - baseline['rss_mb']
+        if growth > args.max_rss_growth:
+            problems.append(f"RSS вырос на {growth:.1f} МБ (порог {args.max_rss_growth} МБ)")
+    growth = last['traced_mb'] - baseline['traced_mb']
+    if growth > args.max_traced_growth:
+        problems.append(f"tracemalloc вырос на {growth:.2f} МБ (порог {args.max_traced_growth} МБ)")
+    growth = last['tk_images'] - baseline['tk_images']
+    if growth > args.max_image_growth:
+        problems.append(f"изображений Tk стало больше на {growth} (порог {args.max_image_growth})")
+    growth = last['toplevels'] - baseline['toplevels']
+    if growth > 0:
+        problems.append(f"не закрыто окон верхнего уровня: {growth}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка Image to Fix Pro на утечки")
+    parser.add_argument('--minutes', type=float, default=120, help="длительность, минут")
+    parser.add_argument('--cycles', type=int, default=0, help="число циклов (0 - по времени)")
+    parser.add_argument('--warmup', type=int, default=5, help="циклов прогрева до замера базы")
+    parser.add_argument('--sample-every', type=int, default=10, help="снимать показатели каждые N циклов")
+    parser.add_argument('--images', help="папка с изображениями (по умолчанию - синтетические)")
+    parser.add_argument('--max-rss-growth', type=float, default=64, help="допустимый рост RSS, МБ")
+    parser.add_argument('--max-traced-growth', type=float, default=16, help="допустимый рост tracemalloc, МБ")
+    parser.add_argument('--max-image-growth', type=int, default=2, help="допустимый рост числа изображений Tk")
+    parser.add_argument('--report', help="JSON-файл с результатами")
+    args = parser.parse_args(argv)
+
+    xvfb = None
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        xvfb = start_xvfb()
+        if xvfb is None:
+            print("Нет DISPLAY и не удалось запустить Xvfb")
+            return 2
+
+    # Настройки и кэш - во временной папке, чтобы не трогать профиль пользователя
+    workdir = tempfile.mkdtemp(prefix='itf-soak-')
+    for name in ('XDG_CONFIG_HOME', 'XDG_CACHE_HOME', 'APPDATA', 'LOCALAPPDATA'):
+        os.environ[name] = os.path.join(workdir, name.lower())
+
+    tracemalloc.start()
+    try:
+        from itf import ImageOverlayApp
+
+        images = list_images(args.images) if args.images else make_images(workdir)
+        if not images:
+            print("Нет изображений для проверки")
+            return 2
+
+        root = tk.Tk()
+        app = ImageOverlayApp(root)
+        runner = SoakRunner(root, app, images)
+        runner.pump(lambda: app.controls_ready)
+
+        started = time.monotonic()
+        deadline = started + args.minutes * 60
+        baseline, baseline_snapshot, samples = None, None, []
+
+        while True:
+            runner.run_cycle()
+
+            if runner.cycle == args.warmup:
+                baseline = runner.sample(started)
+                baseline_snapshot = tracemalloc.take_snapshot()
+                samples.append(baseline)
+                print("База после прогрева:")
+                print_sample(baseline)
+            elif runner.cycle % args.sample_every == 0:
+                samples.append(runner.sample(started))
+                print_sample(samples[-1])
+
+            if args.cycles and runner.cycle >= args.cycles:
+                break
+            if not args.cycles and time.monotonic() >= deadline:
+                break
+
+        last = runner.sample(started)
+        samples.append(last)
+        print("Итог:")
+        print_sample(last)
+
+        problems = []
+        if baseline is None:
+            print("Циклов меньше, чем прогрев: сравнивать не с чем")
+        else:
+            problems = check_growth(baseline, last, args)
+            print("Наибольший рост по tracemalloc:")
+            for stat in tracemalloc.take_snapshot().compare_to(baseline_snapshot, 'lineno')[:10]:
+                print(f"  {stat}")
+
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump({'samples': samples, 'problems': problems}, f, ensure_ascii=False, indent=2)
+
+        app.on_closing()
+        if problems:
+            for problem in problems:
+                print(f"❌ {problem}")
+            return 1
+        print("✅ Рост в пределах порогов")
+        return 0
+    finally:
+        tracemalloc.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+        if xvfb is not None:
+            xvfb.terminate()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
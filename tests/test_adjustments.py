@@ -0,0 +1,53 @@
+"""Коррекция битмапов: шаги по умолчанию пропускаются, префиксы кэшируются"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from itf import AdjustmentPipeline
+
+
+def test_defaults_return_bitmap_itself():
+    pipeline = AdjustmentPipeline()
+    bitmap = Image.new('RGB', (4, 4), (10, 20, 30))
+
+    assert not pipeline.active
+    assert pipeline.apply(bitmap) is bitmap
+
+
+def test_invert_keeps_alpha():
+    pipeline = AdjustmentPipeline()
+    pipeline.update({'invert': True, 'unknown': 1})
+
+    result = pipeline.apply(Image.new('RGBA', (2, 2), (10, 20, 30, 40)))
+
+    assert result.getpixel((0, 0)) == (245, 235, 225, 40)
+    assert 'unknown' not in pipeline.params
+
+
+def test_changing_last_stage_reuses_earlier_stages():
+    pipeline = AdjustmentPipeline()
+    bitmap = Image.new('RGB', (8, 8), (100, 150, 200))
+    pipeline.update({'grayscale': True, 'brightness': 50})
+    pipeline.apply(bitmap)
+    computed = pipeline.stats['computed']
+
+    pipeline.update({'brightness': 80})
+    result = pipeline.apply(bitmap)
+
+    assert pipeline.stats['computed'] == computed + 1
+    gray = Image.new('RGB', (1, 1), (100, 150, 200)).convert('L').getpixel((0, 0))
+    assert result.getpixel((0, 0)) == (int(gray * 0.8),) * 3
+
+
+def test_stages_snapshot_is_independent_of_later_updates():
+    pipeline = AdjustmentPipeline()
+    pipeline.update({'contrast': 150})
+    stages = pipeline.stages()
+    pipeline.reset()
+
+    result = pipeline.apply(Image.new('RGB', (1, 1), (200, 200, 200)), stages)
+
+    assert result.getpixel((0, 0)) == (236, 236, 236)
@@ -0,0 +1,59 @@
+"""Управление цветом: перевод в профиль экрана и пропуск ненужного перевода"""
+import io
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageCms
+
+from itf import ColorManager, decode_image
+
+
+def srgb_profile():
+    return ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB'))
+
+
+def swapped_primaries(icc):
+    """sRGB с переставленными красным и синим основными цветами"""
+    data = bytearray(icc)
+    count = struct.unpack_from('>I', data, 128)[0]
+    entries = {}
+    for i in range(count):
+        pos = 132 + i * 12
+        entries[bytes(data[pos:pos + 4])] = pos
+    red, blue = entries[b'rXYZ'], entries[b'bXYZ']
+    data[red + 4:red + 12], data[blue + 4:blue + 12] = data[blue + 4:blue + 12], data[red + 4:red + 12]
+    return bytes(data)
+
+
+def manager(display):
+    color = ColorManager()
+    color.display = display
+    color.display_key = 'test'
+    return color
+
+
+def test_same_profile_is_not_converted(tmp_path):
+    icc = srgb_profile().tobytes()
+    path = str(tmp_path / 'srgb.png')
+    source = Image.effect_noise((64, 48), 60).convert('RGB')
+    source.save(path, icc_profile=icc)
+
+    decoded = decode_image(path, color=manager(srgb_profile()))
+
+    assert decoded['icc'] is None
+    assert decoded['image'].tobytes() == source.tobytes()
+
+
+def test_different_profile_is_converted():
+    icc = swapped_primaries(srgb_profile().tobytes())
+    color = manager(srgb_profile())
+    image = Image.new('RGB', (4, 4), (200, 30, 30))
+
+    converted = color.convert(image, icc)
+
+    assert converted is not image
+    assert converted.getpixel((0, 0))[2] > converted.getpixel((0, 0))[0]
+    assert color.stats['identity'] == 0
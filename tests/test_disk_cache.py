@@ -0,0 +1,55 @@
+"""Кэш битмапов на диске: ключ по файлу, чтение и вытеснение"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from itf import DiskBitmapCache
+
+
+def source_file(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(name.encode('utf-8'))
+    return str(path)
+
+
+def test_roundtrip_with_max_size(tmp_path):
+    cache = DiskBitmapCache(str(tmp_path / 'cache'))
+    path = source_file(tmp_path, 'a.png')
+    bitmap = Image.effect_noise((200, 100), 40).convert('RGB')
+
+    cache.write(cache.key(path, 'preview'), bitmap, (50, 50))
+    cached = cache.get(path, 'preview')
+
+    assert cached.size == (50, 25)
+    assert cache.get(path, 'overlay') is None
+
+
+def test_changed_source_misses(tmp_path):
+    cache = DiskBitmapCache(str(tmp_path / 'cache'))
+    path = source_file(tmp_path, 'a.png')
+    cache.write(cache.key(path, 'preview'), Image.new('RGBA', (4, 4)), None)
+
+    with open(path, 'ab') as f:
+        f.write(b'changed')
+
+    assert cache.get(path, 'preview') is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    bitmap = Image.new('RGB', (32, 32))
+    cache = DiskBitmapCache(str(tmp_path / 'cache'), max_bytes=3 * 32 * 32 * 3)
+    paths = [source_file(tmp_path, f'{name}.png') for name in 'abc']
+
+    cache.write(cache.key(paths[0], 'preview'), bitmap, None)
+    cache.write(cache.key(paths[1], 'preview'), bitmap, None)
+    old = time.time() - 60
+    os.utime(cache.file_for(cache.key(paths[1], 'preview')), (old, old))
+    cache.write(cache.key(paths[2], 'preview'), bitmap, None)
+
+    assert cache.get(paths[1], 'preview') is None
+    assert cache.get(paths[0], 'preview') is not None
+    assert cache.get(paths[2], 'preview') is not None
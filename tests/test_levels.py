@@ -0,0 +1,76 @@
+"""Уровни многоуровневых файлов: image_levels, choose_level, decode_image, decode_export"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from itf import choose_level, decode_export, decode_image, image_levels, open_image
+
+
+def save_pages(path, pages):
+    pages[0].save(path, compression='tiff_lzw', save_all=True, append_images=pages[1:])
+
+
+def test_multipage_document_is_not_a_pyramid(tmp_path):
+    path = str(tmp_path / 'scan.tif')
+    save_pages(path, [Image.new('RGB', (64, 48), color) for color in ('red', 'green', 'blue')])
+
+    assert image_levels(open_image(path)) == []
+
+    decoded = decode_image(path, target_size=(10, 10))
+    assert decoded['level'] is None
+    assert decoded['image'].getpixel((0, 0)) == (255, 0, 0)
+
+
+def test_pyramid_skips_equal_size_duplicates(tmp_path):
+    path = str(tmp_path / 'pyramid.tif')
+    sizes = ((800, 600), (800, 600), (400, 300), (200, 150), (100, 75))
+    save_pages(path, [Image.new('RGB', size) for size in sizes])
+
+    levels = image_levels(open_image(path))
+
+    assert levels == [(0, (800, 600)), (2, (400, 300)), (3, (200, 150)), (4, (100, 75))]
+
+
+def test_pyramid_decodes_smallest_sufficient_level(tmp_path):
+    path = str(tmp_path / 'pyramid.tif')
+    save_pages(path, [Image.new('RGB', (800 // 2 ** i, 600 // 2 ** i)) for i in range(4)])
+
+    decoded = decode_image(path, target_size=(300, 200))
+
+    assert decoded['level'] == 1
+    assert decoded['image'].size == (400, 300)
+    assert decoded['source_size'] == (800, 600)
+
+
+def test_choose_level():
+    levels = [(0, (800, 600)), (1, (400, 300)), (2, (200, 150))]
+
+    assert choose_level(levels, (250, 150)) == 1
+    assert choose_level(levels, (200, 150)) == 2
+    assert choose_level(levels, (1000, 1000)) == 0
+    assert choose_level(levels) == 0
+
+
+def test_export_decodes_smallest_sufficient_size(tmp_path):
+    pyramid = str(tmp_path / 'pyramid.tif')
+    save_pages(pyramid, [Image.new('RGB', (800 // 2 ** i, 600 // 2 ** i)) for i in range(4)])
+    photo = str(tmp_path / 'photo.jpg')
+    Image.new('RGB', (800, 600), 'red').save(photo)
+
+    assert decode_export(pyramid, (150, 100))['image'].size == (200, 150)
+    assert decode_export(photo, (150, 100))['image'].size == (200, 150)
+    assert decode_export(photo, (800, 600))['image'].size == (800, 600)
+
+
+def test_export_over_budget_is_an_error(tmp_path):
+    path = str(tmp_path / 'big.png')
+    Image.new('RGB', (1000, 1000)).save(path)
+
+    with pytest.raises(ValueError):
+        decode_export(path, (1000, 1000), budget_bytes=100_000)
+    assert decode_export(path, (1000, 1000), budget_bytes=1_000_000)['image'].size == (1000, 1000)
@@ -0,0 +1,37 @@
+"""Открытие очень больших изображений (open_image) без ошибки Pillow о "бомбе\""""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PIL.Image
+
+from itf import Image, open_image
+
+
+@pytest.fixture
+def small_limit(monkeypatch):
+    monkeypatch.setattr(PIL.Image, 'MAX_IMAGE_PIXELS', 1000)
+
+
+def test_open_image_ignores_decompression_bomb_limit(tmp_path, small_limit):
+    path = str(tmp_path / 'big.png')
+    PIL.Image.new('RGB', (100, 100), 'red').save(path)
+
+    with pytest.raises(PIL.Image.DecompressionBombError):
+        PIL.Image.open(path)
+
+    image = open_image(path)
+
+    assert image.size == (100, 100)
+    # Ограничение вернулось в модуль, а не осталось на прокси
+    assert PIL.Image.MAX_IMAGE_PIXELS == 1000
+    assert 'MAX_IMAGE_PIXELS' not in vars(Image)
+
+
+def test_lazy_module_forwards_attribute_writes(monkeypatch):
+    monkeypatch.setattr(PIL.Image, 'MAX_IMAGE_PIXELS', PIL.Image.MAX_IMAGE_PIXELS)
+    Image.MAX_IMAGE_PIXELS = 12345
+    assert PIL.Image.MAX_IMAGE_PIXELS == 12345
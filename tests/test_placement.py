@@ -0,0 +1,31 @@
+"""Положение окна поверх экрана: позиции и прилипание к краям монитора"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from itf import anchor_point, snap_position
+
+
+def test_anchor_point_is_relative_to_monitor():
+    assert anchor_point('top-left', 200, 100, 1920, 1080) == (10, 30)
+    assert anchor_point('center', 200, 100, 1920, 1080, origin=(1920, 0)) == (1920 + 860, 490)
+    assert anchor_point('bottom-right', 200, 100, 1920, 1080, origin=(-1280, 0)) == (-1280 + 1710, 930)
+
+
+def test_snap_to_position():
+    ax, ay = anchor_point('top-right', 200, 100, 1920, 1080)
+
+    assert snap_position(ax - 5, ay + 7, 200, 100, 1920, 1080) == (ax, ay, 'top-right')
+
+
+def test_snap_to_edges_of_second_monitor():
+    origin = (1920, 0)
+
+    assert snap_position(1925, 400, 200, 100, 1280, 1024, origin=origin) == (1920, 400, None)
+    assert snap_position(1920 + 1280 - 210, 1024 - 95, 200, 100, 1280, 1024, origin=origin) == \
+        (1920 + 1280 - 200, 1024 - 100, None)
+
+
+def test_no_snap_far_from_edges():
+    assert snap_position(500, 400, 200, 100, 1920, 1080) == (500, 400, None)
@@ -0,0 +1,63 @@
+"""Чтение области исходника (read_region) для сжатых и пирамидальных TIFF"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from itf import BoundedCache, read_region
+
+
+@pytest.fixture
+def source():
+    return Image.effect_noise((600, 400), 60).convert('RGB')
+
+
+def test_lzw_tiff_region_is_full_resolution(tmp_path, source):
+    path = str(tmp_path / 'lzw.tif')
+    source.save(path, compression='tiff_lzw')
+    box = (100, 50, 300, 250)
+
+    region = read_region(path, box)
+
+    assert region is not None
+    assert region.size == (200, 200)
+    assert region.tobytes() == source.crop(box).tobytes()
+
+
+def test_raw_tiff_region_reads_rows(tmp_path, source):
+    path = str(tmp_path / 'raw.tif')
+    source.save(path)
+    box = (10, 20, 110, 220)
+
+    assert read_region(path, box).tobytes() == source.crop(box).tobytes()
+
+
+def test_pyramid_region_uses_largest_level_within_budget(tmp_path, source):
+    path = str(tmp_path / 'pyramid.tif')
+    levels = [source.resize((600 // 2 ** i, 400 // 2 ** i)) for i in (1, 2)]
+    source.save(path, compression='tiff_lzw', save_all=True, append_images=levels)
+
+    # Полный уровень (720 000 байт) не помещается в 4 бюджета, половинный - помещается
+    region = read_region(path, (100, 100, 300, 300), budget_bytes=50_000)
+
+    assert region.size == (100, 100)
+    assert region.tobytes() == levels[0].crop((50, 50, 150, 150)).tobytes()
+
+
+def test_decoded_level_is_reused_for_next_regions(tmp_path, source):
+    path = str(tmp_path / 'lzw.tif')
+    source.save(path, compression='tiff_lzw')
+    cache = BoundedCache(1)
+
+    read_region(path, (0, 0, 10, 10), cache=cache)
+    decoded = cache.values()
+    box = (200, 100, 400, 300)
+    region = read_region(path, box, cache=cache)
+
+    assert len(decoded) == 1
+    assert cache.values()[0] is decoded[0]
+    assert region.tobytes() == source.crop(box).tobytes()
@@ -0,0 +1,91 @@
+"""Фоновая обработка: поколения целей, отмена и доставка результатов"""
+import os
+import queue
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from itf import RenderScheduler
+
+
+class UiThread:
+    """Очередь вместо потока Tk: deliver кладет, drain выполняет"""
+    def __init__(self):
+        self.calls = queue.Queue()
+
+    def deliver(self, func, *args):
+        self.calls.put((func, args))
+
+    def drain(self, scheduler, timeout=5):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                func, args = self.calls.get(timeout=0.01)
+            except queue.Empty:
+                if not scheduler.snapshot()['pending']:
+                    return
+                continue
+            func(*args)
+
+
+def test_newer_task_replaces_older_result():
+    ui = UiThread()
+    scheduler = RenderScheduler(ui.deliver, workers=1)
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def slow(check, value):
+        started.set()
+        release.wait(5)
+        return value
+
+    scheduler.submit('preview', slow, (1,), on_done=results.append)
+    started.wait(5)
+    scheduler.submit('preview', lambda check, value: value, (2,), on_done=results.append)
+    release.set()
+    ui.drain(scheduler)
+
+    assert results == [2]
+    assert scheduler.snapshot()['dropped'] == 1
+
+
+def test_cancel_interrupts_running_task():
+    ui = UiThread()
+    scheduler = RenderScheduler(ui.deliver, workers=1)
+    started = threading.Event()
+    results = []
+
+    def long(check):
+        started.set()
+        while True:
+            check()
+            time.sleep(0.001)
+
+    scheduler.submit(('export', 'a.png'), long, on_done=results.append)
+    started.wait(5)
+    scheduler.cancel(('export', 'a.png'))
+    ui.drain(scheduler)
+
+    assert results == []
+    assert scheduler.snapshot()['cancelled'] == 1
+
+
+def test_error_goes_to_on_error_and_targets_are_independent():
+    ui = UiThread()
+    scheduler = RenderScheduler(ui.deliver, workers=2)
+    errors, results = [], []
+
+    def fail(check):
+        raise ValueError("нет файла")
+
+    scheduler.submit('load', fail, on_error=errors.append)
+    scheduler.submit('overlay', lambda check: 'bitmap', on_done=results.append)
+    ui.drain(scheduler)
+
+    assert [str(e) for e in errors] == ["нет файла"]
+    assert results == ['bitmap']
+    stats = scheduler.snapshot()
+    assert (stats['failed'], stats['completed'], stats['pending'], stats['queued']) == (1, 1, 0, 0)
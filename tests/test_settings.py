@@ -0,0 +1,52 @@
+"""Настройки: отложенная запись и запись без гонок"""
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from itf import SettingsStore
+
+
+def test_update_is_written_after_delay(tmp_path):
+    path = str(tmp_path / 'itf' / 'settings.json')
+    store = SettingsStore(path, delay=0.05)
+    store.update({'session': {'path': 'a.png'}})
+
+    deadline = time.time() + 5
+    while not os.path.exists(path) and time.time() < deadline:
+        time.sleep(0.01)
+
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)['session'] == {'path': 'a.png'}
+
+
+def test_flush_and_background_writes_do_not_collide(tmp_path):
+    path = str(tmp_path / 'settings.json')
+    store = SettingsStore(path, delay=0)
+
+    def writer(n):
+        for i in range(50):
+            store.update({'value': n * 100 + i})
+            store.flush()
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.flush()
+
+    with open(path, encoding='utf-8') as f:
+        assert json.load(f)['value'] == store.data['value']
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.tmp')] == []
+
+
+def test_load_falls_back_to_legacy_file(tmp_path):
+    legacy = tmp_path / 'settings.json'
+    legacy.write_text('{"bind_key": "ctrl+q"}', encoding='utf-8')
+    store = SettingsStore(str(tmp_path / 'itf' / 'settings.json'))
+
+    assert store.load(str(legacy)) == {'bind_key': 'ctrl+q'}
@@ -0,0 +1,61 @@
+"""Листание папки: естественная сортировка и поиск текущего файла"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from itf import FolderSlideshow, natural_sort_key
+
+
+def test_natural_sort_key():
+    names = ['img10.png', 'IMG2.png', 'img1.png', 'a.png']
+
+    assert sorted(names, key=natural_sort_key) == ['a.png', 'img1.png', 'IMG2.png', 'img10.png']
+
+
+def listed(tmp_path, names):
+    for name in names:
+        (tmp_path / name).write_bytes(b'')
+    slideshow = FolderSlideshow(decoder=lambda path: {'image': Image.new('RGB', (1, 1))})
+    slideshow.prefetch = 0
+    slideshow.open(str(tmp_path))
+    deadline = time.time() + 5
+    while not slideshow.listing_done and time.time() < deadline:
+        time.sleep(0.01)
+    return slideshow
+
+
+def test_index_of_matches_other_spellings(tmp_path):
+    slideshow = listed(tmp_path, ['img1.png', 'img2.png', 'img10.png'])
+    path = os.path.join(str(tmp_path), 'sub', '..', 'img2.png')
+
+    with slideshow.lock:
+        assert slideshow.index_of(path) == 1
+        assert slideshow.index_of(os.path.join(str(tmp_path), 'img3.png')) is None
+
+
+def test_step_from_current_file(tmp_path):
+    slideshow = listed(tmp_path, ['img1.png', 'img2.png', 'img10.png'])
+    slideshow.current = os.path.join(str(tmp_path), '.', 'img2.png')
+
+    assert slideshow.is_current(os.path.join(str(tmp_path), 'img2.png'))
+    assert os.path.basename(slideshow.step(1)) == 'img10.png'
+    assert os.path.basename(slideshow.step(1)) == 'img1.png'
+    assert slideshow.position() == (1, 3)
+
+
+def test_single_file_prefetches_only_after_step(tmp_path):
+    slideshow = listed(tmp_path, ['img1.png', 'img2.png', 'img10.png'])
+    slideshow.prefetch = 1
+    slideshow.current = os.path.join(str(tmp_path), 'img2.png')
+    slideshow.plan = ['stale']
+    with slideshow.lock:
+        slideshow.update_plan()
+        assert slideshow.plan == []
+
+    slideshow.step(1)
+
+    assert slideshow.active
@@ -0,0 +1,39 @@
+"""Поток кадров для --stream: длина (big-endian) и данные изображения"""
+import io
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from itf import read_frames
+
+
+def frames(*chunks):
+    return b''.join(struct.pack('>I', len(chunk)) + chunk for chunk in chunks)
+
+
+def test_frames_until_end_of_stream():
+    assert list(read_frames(io.BytesIO(frames(b'one', b'two')))) == [b'one', b'two']
+
+
+def test_empty_frame_ends_stream():
+    stream = io.BytesIO(frames(b'one', b'', b'ignored'))
+
+    assert list(read_frames(stream)) == [b'one']
+
+
+def test_truncated_frame_is_an_error():
+    stream = io.BytesIO(frames(b'complete')[:-3])
+
+    with pytest.raises(ValueError):
+        list(read_frames(stream))
+
+
+def test_oversized_frame_is_an_error():
+    stream = io.BytesIO(struct.pack('>I', 0xFFFFFFFF))
+
+    with pytest.raises(ValueError):
+        list(read_frames(stream))